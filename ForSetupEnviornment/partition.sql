@@ -0,0 +1,405 @@
+-- Partition matches and match_players by month of game_end_datetime,
+-- and add archive tables for old and untracked rows.
+-- Run after sql.sql, then keep partitions ahead with tiering.py
+USE gumawilson;
+
+
+-- Partitioned tables cannot have foreign keys,
+-- and every unique key must include the partition column
+ALTER TABLE `gumawilson`.`match_players` DROP FOREIGN KEY `match_id`;
+
+ALTER TABLE `gumawilson`.`match_players`
+  ADD COLUMN `game_end_datetime` DATETIME(3) NOT NULL DEFAULT '1970-01-01 00:00:00' AFTER `win`;
+
+UPDATE match_players
+INNER JOIN matches ON matches.match_id = match_players.match_id
+SET match_players.game_end_datetime = matches.game_end_datetime;
+
+-- Create match_index table, the partition column of every match, hot or archived.
+-- Lookups by match id read it first, then probe only the partition of the match.
+CREATE TABLE `gumawilson`.`match_index` (
+  `match_id` VARCHAR(45) NOT NULL,
+  `game_end_datetime` DATETIME(3) NOT NULL,
+  PRIMARY KEY (`match_id`))
+ENGINE = InnoDB
+DEFAULT CHARACTER SET = utf8;
+
+INSERT INTO match_index (match_id, game_end_datetime)
+SELECT match_id, MIN(game_end_datetime) FROM matches GROUP BY match_id;
+
+-- A match always has the same game_end_datetime, so these keep match ids unique
+ALTER TABLE `gumawilson`.`matches`
+  DROP PRIMARY KEY,
+  DROP INDEX `id_UNIQUE`,
+  DROP INDEX `match_id_UNIQUE`,
+  ADD PRIMARY KEY (`id`, `game_end_datetime`),
+  ADD UNIQUE INDEX `match_id_UNIQUE` (`match_id` ASC, `game_end_datetime` ASC) VISIBLE;
+
+ALTER TABLE `gumawilson`.`match_players`
+  DROP PRIMARY KEY,
+  DROP INDEX `id_UNIQUE`,
+  DROP INDEX `match_id_idx`,
+  ADD PRIMARY KEY (`id`, `game_end_datetime`),
+  ADD UNIQUE INDEX `match_id_puuid_UNIQUE` (`match_id` ASC, `puuid` ASC, `game_end_datetime` ASC) VISIBLE,
+  ADD INDEX `puuid_end_idx` (`puuid` ASC, `game_end_datetime` ASC) VISIBLE;
+
+-- Monthly partitions are split from pmax by sp_add_month_partitions
+ALTER TABLE `gumawilson`.`matches`
+PARTITION BY RANGE (TO_DAYS(game_end_datetime)) (
+  PARTITION p_old VALUES LESS THAN (TO_DAYS('2023-01-01')),
+  PARTITION pmax VALUES LESS THAN MAXVALUE
+);
+
+ALTER TABLE `gumawilson`.`match_players`
+PARTITION BY RANGE (TO_DAYS(game_end_datetime)) (
+  PARTITION p_old VALUES LESS THAN (TO_DAYS('2023-01-01')),
+  PARTITION pmax VALUES LESS THAN MAXVALUE
+);
+
+
+-- Create archive tables, compressed and only indexed for lookups by match and player
+CREATE TABLE `gumawilson`.`matches_archive` (
+  `match_id` varchar(45) NOT NULL,
+  `region_v5` varchar(45) NOT NULL,
+  `gameStartTimestamp` bigint NOT NULL,
+  `gameMode` varchar(45) NOT NULL,
+  `gameType` varchar(45) NOT NULL,
+  `gameDuration` int NOT NULL,
+  `gameEndTimestamp` bigint NOT NULL,
+  `gameEndedInEarlySurrender` tinyint NOT NULL,
+  `queueId` int NOT NULL,
+  `platformId` varchar(45) NOT NULL,
+  `game_end_datetime` datetime(3) NOT NULL,
+  PRIMARY KEY (`match_id`))
+ENGINE = InnoDB
+ROW_FORMAT = COMPRESSED
+DEFAULT CHARACTER SET = utf8;
+
+CREATE TABLE `gumawilson`.`match_players_archive` (
+  `puuid` VARCHAR(100) NOT NULL,
+  `match_id` VARCHAR(45) NOT NULL,
+  `kills` INT NOT NULL,
+  `deaths` INT NOT NULL,
+  `assists` INT NOT NULL,
+  `champion_name` VARCHAR(100) NOT NULL,
+  `gold_earned` INT NOT NULL,
+  `individual_posistion` VARCHAR(45) NOT NULL,
+  `damage_to_champions` INT NOT NULL,
+  `minions_killed` INT NOT NULL,
+  `win` TINYINT NOT NULL DEFAULT 0,
+  `game_end_datetime` DATETIME(3) NOT NULL,
+  PRIMARY KEY (`match_id`, `puuid`),
+  INDEX `puuid_end_idx` (`puuid` ASC, `game_end_datetime` ASC) VISIBLE)
+ENGINE = InnoDB
+ROW_FORMAT = COMPRESSED
+DEFAULT CHARACTER SET = utf8;
+
+
+-- Stored procedures
+USE `gumawilson`;
+DROP procedure IF EXISTS `sp_add_month_partitions`;
+
+DELIMITER $$
+USE `gumawilson`$$
+CREATE PROCEDURE `sp_add_month_partitions` (
+  IN p_table VARCHAR(64),
+  IN p_months_ahead INT
+)
+BEGIN
+  DECLARE v_bound INT;
+  DECLARE v_month DATE;
+  DECLARE v_last_month DATE;
+
+  SET v_last_month = DATE_FORMAT(NOW() + INTERVAL p_months_ahead MONTH, '%Y-%m-01');
+  SELECT MAX(CAST(PARTITION_DESCRIPTION AS UNSIGNED)) INTO v_bound
+  FROM information_schema.PARTITIONS
+  WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = p_table AND PARTITION_NAME <> 'pmax';
+  -- The month after the last partition
+  SET v_month = FROM_DAYS(v_bound);
+
+  WHILE v_month <= v_last_month DO
+    SET @sql = CONCAT(
+      'ALTER TABLE ', p_table, ' REORGANIZE PARTITION pmax INTO (',
+      'PARTITION p', DATE_FORMAT(v_month, '%Y%m'),
+      ' VALUES LESS THAN (', TO_DAYS(v_month + INTERVAL 1 MONTH), '), ',
+      'PARTITION pmax VALUES LESS THAN MAXVALUE)'
+    );
+    PREPARE statement FROM @sql;
+    EXECUTE statement;
+    DEALLOCATE PREPARE statement;
+    SET v_month = v_month + INTERVAL 1 MONTH;
+  END WHILE;
+END$$
+
+DELIMITER ;
+
+USE `gumawilson`;
+DROP procedure IF EXISTS `sp_archive_before`;
+
+DELIMITER $$
+USE `gumawilson`$$
+CREATE PROCEDURE `sp_archive_before` (
+  IN p_before DATE
+)
+BEGIN
+  DECLARE v_table VARCHAR(64);
+  DECLARE v_partition VARCHAR(64);
+
+  -- Copy first, INSERT IGNORE makes a rerun after a crash safe
+  START TRANSACTION;
+  INSERT IGNORE INTO matches_archive (match_id, region_v5, gameStartTimestamp, gameMode, gameType, gameDuration, gameEndTimestamp, gameEndedInEarlySurrender, queueId, platformId, game_end_datetime)
+  SELECT match_id, region_v5, gameStartTimestamp, gameMode, gameType, gameDuration, gameEndTimestamp, gameEndedInEarlySurrender, queueId, platformId, game_end_datetime
+  FROM matches WHERE game_end_datetime < p_before;
+  INSERT IGNORE INTO match_players_archive (puuid, match_id, kills, deaths, assists, champion_name, gold_earned, individual_posistion, damage_to_champions, minions_killed, win, game_end_datetime)
+  SELECT puuid, match_id, kills, deaths, assists, champion_name, gold_earned, individual_posistion, damage_to_champions, minions_killed, win, game_end_datetime
+  FROM match_players WHERE game_end_datetime < p_before;
+  COMMIT;
+
+  -- Drop whole partitions before p_before, much cheaper than deleting their rows
+  drop_loop: LOOP
+    SET v_partition = NULL;
+    SELECT TABLE_NAME, PARTITION_NAME INTO v_table, v_partition
+    FROM information_schema.PARTITIONS
+    WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME IN ('matches', 'match_players')
+    AND PARTITION_NAME <> 'pmax'
+    AND CAST(PARTITION_DESCRIPTION AS UNSIGNED) <= TO_DAYS(p_before)
+    LIMIT 1;
+    IF v_partition IS NULL THEN
+      LEAVE drop_loop;
+    END IF;
+    SET @sql = CONCAT('ALTER TABLE ', v_table, ' DROP PARTITION ', v_partition);
+    PREPARE statement FROM @sql;
+    EXECUTE statement;
+    DEALLOCATE PREPARE statement;
+  END LOOP;
+
+  -- Rows left in the partition containing p_before
+  DELETE FROM match_players WHERE game_end_datetime < p_before;
+  DELETE FROM matches WHERE game_end_datetime < p_before;
+  COMMIT;
+END$$
+
+DELIMITER ;
+
+USE `gumawilson`;
+DROP procedure IF EXISTS `sp_archive_untracked_match_players`;
+
+DELIMITER $$
+USE `gumawilson`$$
+CREATE PROCEDURE `sp_archive_untracked_match_players` (
+  IN p_before DATETIME,
+  OUT p_archived INT
+)
+BEGIN
+  -- Rows of players not in summoners, i.e. the other nine players of a game.
+  -- Their matches stay hot until sp_archive_before, readers fall back from
+  -- match_players_archive to matches, then to matches_archive.
+  START TRANSACTION;
+  INSERT IGNORE INTO match_players_archive (puuid, match_id, kills, deaths, assists, champion_name, gold_earned, individual_posistion, damage_to_champions, minions_killed, win, game_end_datetime)
+  SELECT mp.puuid, mp.match_id, mp.kills, mp.deaths, mp.assists, mp.champion_name, mp.gold_earned, mp.individual_posistion, mp.damage_to_champions, mp.minions_killed, mp.win, mp.game_end_datetime
+  FROM match_players mp
+  LEFT JOIN summoners s ON s.puuid = mp.puuid
+  WHERE mp.game_end_datetime < p_before AND s.puuid IS NULL;
+
+  DELETE mp FROM match_players mp
+  LEFT JOIN summoners s ON s.puuid = mp.puuid
+  WHERE mp.game_end_datetime < p_before AND s.puuid IS NULL;
+  SET p_archived = ROW_COUNT();
+  COMMIT;
+END$$
+
+DELIMITER ;
+
+-- Procedures from sql.sql that find a match by match_index, also read the archive
+-- or write game_end_datetime. Filtering by game_end_datetime read from match_index
+-- lets MySQL probe only one partition instead of all of them.
+USE `gumawilson`;
+DROP procedure IF EXISTS `sp_match_exists`;
+
+DELIMITER $$
+USE `gumawilson`$$
+CREATE PROCEDURE `sp_match_exists` (
+  IN p_match_id VARCHAR(45),
+  OUT match_exists BOOLEAN
+)
+BEGIN
+  -- Archived matches stay in match_index
+  SELECT COUNT(*) INTO match_exists FROM match_index WHERE match_id = p_match_id;
+END$$
+
+DELIMITER ;
+
+USE `gumawilson`;
+DROP procedure IF EXISTS `sp_add_new_match`;
+
+DELIMITER $$
+USE `gumawilson`$$
+CREATE PROCEDURE `sp_add_new_match` (
+  IN p_match_id VARCHAR(45),
+  IN p_region_v5 VARCHAR(45),
+  IN p_gameStartTimestamp BIGINT,
+  IN p_gameMode VARCHAR(45),
+  IN p_gameType VARCHAR(45),
+  IN p_gameDuration INT,
+  IN p_gameEndTimestamp BIGINT,
+  IN p_gameEndedInEarlySurrender BOOLEAN,
+  IN p_queueId INT,
+  IN p_platformId VARCHAR(45),
+  IN p_game_end_datetime DATETIME(3)
+)
+BEGIN
+  -- The primary key of match_index lets only one of concurrent inserts of a match through
+  INSERT IGNORE INTO match_index (match_id, game_end_datetime)
+  VALUES (p_match_id, p_game_end_datetime);
+  IF ROW_COUNT() > 0
+  THEN
+    INSERT INTO matches (match_id, region_v5, gameStartTimestamp, gameMode, gameType, gameDuration, gameEndTimestamp, gameEndedInEarlySurrender, queueId, platformId, game_end_datetime)
+    VALUES (p_match_id, p_region_v5, p_gameStartTimestamp, p_gameMode, p_gameType, p_gameDuration, p_gameEndTimestamp, p_gameEndedInEarlySurrender, p_queueId, p_platformId, p_game_end_datetime);
+  END IF;
+END$$
+
+DELIMITER ;
+
+USE `gumawilson`;
+DROP procedure IF EXISTS `sp_add_new_match_players_record`;
+
+DELIMITER $$
+USE `gumawilson`$$
+CREATE PROCEDURE `sp_add_new_match_players_record` (
+  IN p_puuid VARCHAR(100),
+  IN p_match_id VARCHAR(45),
+  IN p_kills INT,
+  IN p_deaths INT,
+  IN p_assists INT,
+  IN p_champion_name VARCHAR(100),
+  IN p_gold_earned INT,
+  IN p_individual_posistion VARCHAR(45),
+  IN p_damage_to_champions INT,
+  IN p_minions_killed INT,
+  IN p_win BOOLEAN
+)
+BEGIN
+  DECLARE v_game_end_datetime DATETIME(3);
+  -- Partition column, the match is inserted before its players in the same transaction
+  SELECT game_end_datetime INTO v_game_end_datetime FROM match_index WHERE match_id = p_match_id;
+  -- match_id_puuid_UNIQUE skips a player inserted already
+  INSERT IGNORE INTO match_players (puuid, match_id, kills, deaths, assists, champion_name, gold_earned, individual_posistion, damage_to_champions, minions_killed, win, game_end_datetime)
+  VALUES (p_puuid, p_match_id, p_kills, p_deaths, p_assists, p_champion_name, p_gold_earned, p_individual_posistion, p_damage_to_champions, p_minions_killed, p_win, v_game_end_datetime);
+END$$
+
+DELIMITER ;
+
+USE `gumawilson`;
+DROP procedure IF EXISTS `sp_check_is_win`;
+
+DELIMITER $$
+USE `gumawilson`$$
+CREATE PROCEDURE `sp_check_is_win` (
+  IN p_match_id VARCHAR(45),
+  IN p_puuid  VARCHAR(100),
+  OUT p_win INT
+)
+BEGIN
+  DECLARE v_game_end_datetime DATETIME(3);
+  DECLARE v_game_duration INT;
+  SET p_win = NULL;
+  SELECT game_end_datetime INTO v_game_end_datetime FROM match_index WHERE match_id = p_match_id;
+
+  -- Rows of untracked players may be archived while their match is still hot
+  SELECT gameDuration INTO v_game_duration FROM matches
+  WHERE match_id = p_match_id AND game_end_datetime = v_game_end_datetime;
+  IF v_game_duration IS NULL
+  THEN
+    SELECT gameDuration INTO v_game_duration FROM matches_archive WHERE match_id = p_match_id;
+  END IF;
+
+  IF v_game_duration > 210
+  THEN
+    SELECT win INTO p_win FROM match_players
+    WHERE match_id = p_match_id AND puuid = p_puuid AND game_end_datetime = v_game_end_datetime;
+    IF p_win IS NULL
+    THEN
+      SELECT win INTO p_win FROM match_players_archive
+      WHERE match_id = p_match_id AND puuid = p_puuid;
+    END IF;
+  END IF;
+END$$
+
+DELIMITER ;
+
+USE `gumawilson`;
+DROP procedure IF EXISTS `gumawilson`.`sp_match_player_detail`;
+
+DELIMITER $$
+USE `gumawilson`$$
+CREATE PROCEDURE `sp_match_player_detail`(
+  IN p_match_id VARCHAR(45),
+  IN p_puuid  VARCHAR(100),
+  OUT p_kills INT,
+  OUT p_deaths INT,
+  OUT p_assists INT,
+  OUT p_champion VARCHAR(100),
+  OUT p_posistion VARCHAR(45),
+  OUT p_minions_killed INT,
+  OUT p_gold_earned INT,
+  OUT p_damage_to_champions INT,
+  OUT p_end_datetime DATETIME(3),
+  OUT p_win INT
+)
+BEGIN
+  DECLARE v_game_end_datetime DATETIME(3);
+  SET p_end_datetime = NULL;
+  SELECT game_end_datetime INTO v_game_end_datetime FROM match_index WHERE match_id = p_match_id;
+  SELECT kills, deaths, assists, champion_name, individual_posistion, minions_killed, gold_earned, damage_to_champions, win, game_end_datetime
+  INTO p_kills, p_deaths, p_assists, p_champion, p_posistion, p_minions_killed, p_gold_earned, p_damage_to_champions, p_win, p_end_datetime
+  FROM match_players
+  WHERE match_id = p_match_id AND puuid = p_puuid AND game_end_datetime = v_game_end_datetime;
+  IF p_end_datetime IS NULL
+  THEN
+    SELECT kills, deaths, assists, champion_name, individual_posistion, minions_killed, gold_earned, damage_to_champions, win, game_end_datetime
+    INTO p_kills, p_deaths, p_assists, p_champion, p_posistion, p_minions_killed, p_gold_earned, p_damage_to_champions, p_win, p_end_datetime
+    FROM match_players_archive
+    WHERE match_id = p_match_id AND puuid = p_puuid;
+  END IF;
+END$$
+
+DELIMITER ;
+
+USE `gumawilson`;
+DROP procedure IF EXISTS `sp_summoner_match_rows`;
+
+DELIMITER $$
+USE `gumawilson`$$
+CREATE PROCEDURE `sp_summoner_match_rows` (
+  IN p_puuid VARCHAR(100)
+)
+BEGIN
+  -- All games of a player except remakes, hot and archived, for analytics.py
+  SELECT match_id, game_end_datetime, win, kills, deaths, assists,
+  gold_earned, damage_to_champions, minions_killed, champion_name, individual_posistion
+  FROM (
+    SELECT match_players.match_id, match_players.game_end_datetime, match_players.win,
+    match_players.kills, match_players.deaths, match_players.assists,
+    match_players.gold_earned, match_players.damage_to_champions, match_players.minions_killed,
+    match_players.champion_name, match_players.individual_posistion
+    FROM match_players
+    INNER JOIN matches ON matches.match_id = match_players.match_id
+    AND matches.game_end_datetime = match_players.game_end_datetime
+    WHERE match_players.puuid = p_puuid AND matches.gameDuration > 210
+    UNION ALL
+    -- An archived row of a player untracked at that time may have its match still hot
+    SELECT match_players_archive.match_id, match_players_archive.game_end_datetime, match_players_archive.win,
+    match_players_archive.kills, match_players_archive.deaths, match_players_archive.assists,
+    match_players_archive.gold_earned, match_players_archive.damage_to_champions, match_players_archive.minions_killed,
+    match_players_archive.champion_name, match_players_archive.individual_posistion
+    FROM match_players_archive
+    LEFT JOIN matches ON matches.match_id = match_players_archive.match_id
+    AND matches.game_end_datetime = match_players_archive.game_end_datetime
+    LEFT JOIN matches_archive ON matches_archive.match_id = match_players_archive.match_id
+    WHERE match_players_archive.puuid = p_puuid
+    AND COALESCE(matches.gameDuration, matches_archive.gameDuration) > 210
+  ) AS games
+  ORDER BY game_end_datetime;
+END$$
+
+DELIMITER ;
@@ -230,3 +230,352 @@ END$$
 
 DELIMITER ;
 
+
+-- Create guild_settings table, default checking parameters of each Discord server
+CREATE TABLE `gumawilson`.`guild_settings` (
+  `guild_id` BIGINT NOT NULL,
+  `default_summoner_name` VARCHAR(100) NOT NULL DEFAULT '',
+  `default_period` VARCHAR(45) NOT NULL DEFAULT '',
+  `region_v4` VARCHAR(45) NOT NULL DEFAULT '',
+  `region_v5` VARCHAR(45) NOT NULL DEFAULT '',
+  `last_update` DATETIME NOT NULL DEFAULT NOW() ON UPDATE NOW(),
+  PRIMARY KEY (`guild_id`))
+ENGINE = InnoDB
+DEFAULT CHARACTER SET = utf8;
+
+USE `gumawilson`;
+DROP procedure IF EXISTS `sp_set_guild_default`;
+
+DELIMITER $$
+USE `gumawilson`$$
+CREATE PROCEDURE `sp_set_guild_default` (
+  IN p_guild_id BIGINT,
+  IN p_summoner_name VARCHAR(100),
+  IN p_period VARCHAR(45),
+  IN p_region_v4 VARCHAR(45),
+  IN p_region_v5 VARCHAR(45)
+)
+BEGIN
+  INSERT INTO guild_settings (guild_id, default_summoner_name, default_period, region_v4, region_v5)
+  VALUES (p_guild_id, p_summoner_name, p_period, p_region_v4, p_region_v5)
+  ON DUPLICATE KEY UPDATE default_summoner_name = p_summoner_name, default_period = p_period,
+    region_v4 = p_region_v4, region_v5 = p_region_v5;
+END$$
+
+DELIMITER ;
+
+USE `gumawilson`;
+DROP procedure IF EXISTS `sp_get_guild_default`;
+
+DELIMITER $$
+USE `gumawilson`$$
+CREATE PROCEDURE `sp_get_guild_default` (
+  IN p_guild_id BIGINT,
+  OUT p_summoner_name VARCHAR(100),
+  OUT p_period VARCHAR(45),
+  OUT p_region_v4 VARCHAR(45),
+  OUT p_region_v5 VARCHAR(45)
+)
+BEGIN
+  SET p_summoner_name = '';
+  SET p_period = '';
+  SET p_region_v4 = '';
+  SET p_region_v5 = '';
+  SELECT default_summoner_name, default_period, region_v4, region_v5
+  INTO p_summoner_name, p_period, p_region_v4, p_region_v5
+  FROM guild_settings
+  WHERE guild_id = p_guild_id;
+END$$
+
+DELIMITER ;
+
+-- Create check_jobs table, checks queued by the gateway and run by worker.py
+CREATE TABLE `gumawilson`.`check_jobs` (
+  `id` BIGINT NOT NULL AUTO_INCREMENT,
+  `guild_id` BIGINT NOT NULL,
+  `user_id` BIGINT NOT NULL,
+  `summoner_name` VARCHAR(100) NOT NULL,
+  `period` VARCHAR(45) NOT NULL,
+  `mode` VARCHAR(45) NOT NULL,
+  `region_v4` VARCHAR(45) NOT NULL,
+  `region_v5` VARCHAR(45) NOT NULL,
+  `status` VARCHAR(20) NOT NULL DEFAULT 'queued',
+  `attempts` INT NOT NULL DEFAULT 0,
+  `lease_owner` VARCHAR(100) NULL,
+  `lease_expires` DATETIME NULL,
+  `retry_after` DATETIME NULL,
+  `result` MEDIUMTEXT NULL,
+  `created_on` DATETIME NOT NULL DEFAULT NOW(),
+  `last_update` DATETIME NOT NULL DEFAULT NOW() ON UPDATE NOW(),
+  PRIMARY KEY (`id`),
+  INDEX `status_idx` (`status` ASC, `lease_expires` ASC) VISIBLE,
+  INDEX `check_idx` (`summoner_name` ASC, `period` ASC, `mode` ASC, `region_v4` ASC, `status` ASC) VISIBLE)
+ENGINE = InnoDB
+DEFAULT CHARACTER SET = utf8;
+
+-- Create match_claims table, only one worker gets a match from Riot API
+CREATE TABLE `gumawilson`.`match_claims` (
+  `match_id` VARCHAR(45) NOT NULL,
+  `worker` VARCHAR(100) NOT NULL,
+  `claimed_until` DATETIME NOT NULL,
+  PRIMARY KEY (`match_id`))
+ENGINE = InnoDB
+DEFAULT CHARACTER SET = utf8;
+
+-- Create rate_calls table, Riot API calls of all processes within the longest rate limit window
+CREATE TABLE `gumawilson`.`rate_calls` (
+  `id` BIGINT NOT NULL AUTO_INCREMENT,
+  `called_at` DECIMAL(16,3) NOT NULL,
+  PRIMARY KEY (`id`),
+  INDEX `called_at_idx` (`called_at` ASC) VISIBLE)
+ENGINE = InnoDB
+DEFAULT CHARACTER SET = utf8;
+
+USE `gumawilson`;
+DROP procedure IF EXISTS `sp_enqueue_check_job`;
+
+DELIMITER $$
+USE `gumawilson`$$
+CREATE PROCEDURE `sp_enqueue_check_job` (
+  IN p_guild_id BIGINT,
+  IN p_user_id BIGINT,
+  IN p_summoner_name VARCHAR(100),
+  IN p_period VARCHAR(45),
+  IN p_mode VARCHAR(45),
+  IN p_region_v4 VARCHAR(45),
+  IN p_region_v5 VARCHAR(45),
+  OUT p_job_id BIGINT
+)
+BEGIN
+  -- Share the job if the same check is already waiting or running
+  SET p_job_id = NULL;
+  SELECT id INTO p_job_id FROM check_jobs
+  WHERE summoner_name = p_summoner_name AND period = p_period AND mode = p_mode
+  AND region_v4 = p_region_v4 AND region_v5 = p_region_v5
+  AND status IN ('queued', 'running')
+  ORDER BY id DESC LIMIT 1;
+  IF p_job_id IS NULL
+  THEN
+    INSERT INTO check_jobs (guild_id, user_id, summoner_name, period, mode, region_v4, region_v5)
+    VALUES (p_guild_id, p_user_id, p_summoner_name, p_period, p_mode, p_region_v4, p_region_v5);
+    SET p_job_id = LAST_INSERT_ID();
+  END IF;
+END$$
+
+DELIMITER ;
+
+USE `gumawilson`;
+DROP procedure IF EXISTS `sp_claim_check_job`;
+
+DELIMITER $$
+USE `gumawilson`$$
+CREATE PROCEDURE `sp_claim_check_job` (
+  IN p_worker VARCHAR(100),
+  IN p_lease_seconds INT,
+  IN p_max_attempts INT,
+  OUT p_job_id BIGINT,
+  OUT p_summoner_name VARCHAR(100),
+  OUT p_period VARCHAR(45),
+  OUT p_mode VARCHAR(45),
+  OUT p_region_v4 VARCHAR(45),
+  OUT p_region_v5 VARCHAR(45)
+)
+BEGIN
+  -- Jobs whose worker died too many times
+  UPDATE check_jobs SET status = 'failed', result = 'Worker lease expired', lease_owner = NULL
+  WHERE status = 'running' AND lease_expires < NOW() AND attempts >= p_max_attempts;
+
+  SET p_job_id = NULL;
+  START TRANSACTION;
+  SELECT id, summoner_name, period, mode, region_v4, region_v5
+  INTO p_job_id, p_summoner_name, p_period, p_mode, p_region_v4, p_region_v5
+  FROM check_jobs
+  WHERE (status = 'queued' AND (retry_after IS NULL OR retry_after < NOW()))
+  OR (status = 'running' AND lease_expires < NOW())
+  ORDER BY id LIMIT 1
+  FOR UPDATE SKIP LOCKED;
+  IF p_job_id IS NOT NULL
+  THEN
+    UPDATE check_jobs
+    SET status = 'running', lease_owner = p_worker, attempts = attempts + 1,
+    lease_expires = NOW() + INTERVAL p_lease_seconds SECOND
+    WHERE id = p_job_id;
+  END IF;
+  COMMIT;
+END$$
+
+DELIMITER ;
+
+USE `gumawilson`;
+DROP procedure IF EXISTS `sp_renew_check_job_lease`;
+
+DELIMITER $$
+USE `gumawilson`$$
+CREATE PROCEDURE `sp_renew_check_job_lease` (
+  IN p_job_id BIGINT,
+  IN p_worker VARCHAR(100),
+  IN p_lease_seconds INT
+)
+BEGIN
+  UPDATE check_jobs SET lease_expires = NOW() + INTERVAL p_lease_seconds SECOND
+  WHERE id = p_job_id AND lease_owner = p_worker AND status = 'running';
+END$$
+
+DELIMITER ;
+
+USE `gumawilson`;
+DROP procedure IF EXISTS `sp_complete_check_job`;
+
+DELIMITER $$
+USE `gumawilson`$$
+CREATE PROCEDURE `sp_complete_check_job` (
+  IN p_job_id BIGINT,
+  IN p_worker VARCHAR(100),
+  IN p_result MEDIUMTEXT
+)
+BEGIN
+  UPDATE check_jobs SET status = 'done', result = p_result, lease_owner = NULL
+  WHERE id = p_job_id AND lease_owner = p_worker AND status = 'running';
+END$$
+
+DELIMITER ;
+
+USE `gumawilson`;
+DROP procedure IF EXISTS `sp_fail_check_job`;
+
+DELIMITER $$
+USE `gumawilson`$$
+CREATE PROCEDURE `sp_fail_check_job` (
+  IN p_job_id BIGINT,
+  IN p_worker VARCHAR(100),
+  IN p_max_attempts INT,
+  IN p_retry_seconds INT,
+  IN p_error MEDIUMTEXT
+)
+BEGIN
+  -- Retry by another claim after p_retry_seconds, until p_max_attempts
+  UPDATE check_jobs
+  SET status = IF(attempts >= p_max_attempts, 'failed', 'queued'),
+  result = p_error, lease_owner = NULL, lease_expires = NULL,
+  retry_after = NOW() + INTERVAL p_retry_seconds SECOND
+  WHERE id = p_job_id AND lease_owner = p_worker AND status = 'running';
+END$$
+
+DELIMITER ;
+
+USE `gumawilson`;
+DROP procedure IF EXISTS `sp_get_finished_check_jobs`;
+
+DELIMITER $$
+USE `gumawilson`$$
+CREATE PROCEDURE `sp_get_finished_check_jobs` (
+  IN p_job_ids JSON
+)
+BEGIN
+  -- Jobs in p_job_ids ([id, ...]) that are done or failed, polled in one call by the gateway
+  SELECT check_jobs.id, check_jobs.status, check_jobs.result
+  FROM JSON_TABLE(p_job_ids, '$[*]' COLUMNS (id BIGINT PATH '$')) AS job_ids
+  INNER JOIN check_jobs ON check_jobs.id = job_ids.id
+  WHERE check_jobs.status IN ('done', 'failed');
+END$$
+
+DELIMITER ;
+
+USE `gumawilson`;
+DROP procedure IF EXISTS `sp_claim_match`;
+
+DELIMITER $$
+USE `gumawilson`$$
+CREATE PROCEDURE `sp_claim_match` (
+  IN p_match_id VARCHAR(45),
+  IN p_worker VARCHAR(100),
+  IN p_lease_seconds INT,
+  OUT p_claimed BOOLEAN
+)
+BEGIN
+  -- Take over claims of other workers only after they expired
+  INSERT INTO match_claims (match_id, worker, claimed_until)
+  VALUES (p_match_id, p_worker, NOW() + INTERVAL p_lease_seconds SECOND)
+  ON DUPLICATE KEY UPDATE
+  worker = IF(claimed_until < NOW(), VALUES(worker), worker),
+  claimed_until = IF(worker = VALUES(worker), VALUES(claimed_until), claimed_until);
+  SELECT worker = p_worker INTO p_claimed FROM match_claims WHERE match_id = p_match_id;
+END$$
+
+DELIMITER ;
+
+USE `gumawilson`;
+DROP procedure IF EXISTS `sp_acquire_rate_slot`;
+
+DELIMITER $$
+USE `gumawilson`$$
+CREATE PROCEDURE `sp_acquire_rate_slot` (
+  IN p_limits JSON,
+  OUT p_wait DOUBLE
+)
+BEGIN
+  -- p_limits: [[calls, seconds], ...], a call is counted only if every sliding window has room,
+  -- else p_wait is the seconds until it has
+  DECLARE v_now DECIMAL(16,3);
+  DECLARE v_index INT DEFAULT 0;
+  DECLARE v_limit INT;
+  DECLARE v_window INT;
+  DECLARE v_longest INT DEFAULT 0;
+  DECLARE v_calls INT;
+  DECLARE v_offset INT;
+  DECLARE v_oldest DECIMAL(16,3);
+
+  -- Counting and adding a call of different processes must not interleave
+  DO GET_LOCK('gumawilson_rate_calls', 10);
+  START TRANSACTION;
+  -- Time of the database, the same for every host
+  SET v_now = UNIX_TIMESTAMP(NOW(3));
+  SET p_wait = 0;
+  WHILE v_index < JSON_LENGTH(p_limits) DO
+    SET v_limit = JSON_EXTRACT(p_limits, CONCAT('$[', v_index, '][0]'));
+    SET v_window = JSON_EXTRACT(p_limits, CONCAT('$[', v_index, '][1]'));
+    SET v_longest = GREATEST(v_longest, v_window);
+    SELECT COUNT(*) INTO v_calls FROM rate_calls WHERE called_at > v_now - v_window;
+    IF v_calls >= v_limit
+    THEN
+      -- Wait until the oldest of the last v_limit calls leaves the window
+      SET v_offset = v_limit - 1;
+      SELECT called_at INTO v_oldest FROM rate_calls
+      WHERE called_at > v_now - v_window
+      ORDER BY called_at DESC LIMIT v_offset, 1;
+      SET p_wait = GREATEST(p_wait, v_oldest + v_window - v_now);
+    END IF;
+    SET v_index = v_index + 1;
+  END WHILE;
+  IF p_wait <= 0
+  THEN
+    INSERT INTO rate_calls (called_at) VALUES (v_now);
+    DELETE FROM rate_calls WHERE called_at <= v_now - v_longest;
+  END IF;
+  COMMIT;
+  DO RELEASE_LOCK('gumawilson_rate_calls');
+END$$
+
+DELIMITER ;
+
+USE `gumawilson`;
+DROP procedure IF EXISTS `sp_summoner_match_rows`;
+
+DELIMITER $$
+USE `gumawilson`$$
+CREATE PROCEDURE `sp_summoner_match_rows` (
+  IN p_puuid VARCHAR(100)
+)
+BEGIN
+  -- All games of a player except remakes, for analytics.py
+  SELECT matches.match_id, matches.game_end_datetime, match_players.win,
+  match_players.kills, match_players.deaths, match_players.assists,
+  match_players.gold_earned, match_players.damage_to_champions, match_players.minions_killed,
+  match_players.champion_name, match_players.individual_posistion
+  FROM match_players
+  INNER JOIN matches ON matches.match_id = match_players.match_id
+  WHERE match_players.puuid = p_puuid AND matches.gameDuration > 210
+  ORDER BY matches.game_end_datetime;
+END$$
+
+DELIMITER ;
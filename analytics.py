@@ -0,0 +1,262 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import List
+import numpy as np
+import database_operations as dbo
+import global_variables as gv
+
+TREND_METRICS = ["win_rate", "kda", "damage_per_gold", "hour_of_day", "streak"]
+
+# Codes of champion and posistion names shared by all summoners
+champion_codes = {}
+posistion_codes = {}
+_lock = threading.RLock()
+
+
+def name_code(codes: dict, name: str) -> int:
+    """Code of a champion or posistion name, new names get the next code"""
+    if name not in codes:
+        codes[name] = len(codes)
+    return codes[name]
+
+
+class SummonerColumns:
+    """Games of a summoner as NumPy columns, ordered by game end"""
+
+    def __init__(self, rows: list):
+        self.loaded_at = time.time()
+        self.match_ids = set()
+        # Rows added by ingest, merged to the columns when read
+        self.pending = []
+        self.game_end = np.empty(0, dtype="datetime64[s]")
+        self.win = np.empty(0, dtype=bool)
+        self.kills = np.empty(0, dtype=np.int32)
+        self.deaths = np.empty(0, dtype=np.int32)
+        self.assists = np.empty(0, dtype=np.int32)
+        self.gold = np.empty(0, dtype=np.int32)
+        self.damage = np.empty(0, dtype=np.int32)
+        self.cs = np.empty(0, dtype=np.int32)
+        self.champion = np.empty(0, dtype=np.int16)
+        self.posistion = np.empty(0, dtype=np.int8)
+        for row in rows:
+            self.add(row)
+        self.merge()
+
+    def add(self, row: tuple) -> None:
+        """Add a row in the format of dbo.get_summoner_match_rows"""
+        if row[0] in self.match_ids:
+            return
+        self.match_ids.add(row[0])
+        self.pending.append(row)
+
+    def merge(self) -> None:
+        """Append pending rows to the columns"""
+        if len(self.pending) == 0:
+            return
+        rows = self.pending
+        self.pending = []
+        with _lock:
+            champions = [name_code(champion_codes, row[9]) for row in rows]
+            posistions = [name_code(posistion_codes, row[10]) for row in rows]
+        new_columns = dict(
+            game_end=np.array([row[1] for row in rows], dtype="datetime64[s]"),
+            win=np.array([row[2] for row in rows], dtype=bool),
+            kills=np.array([row[3] for row in rows], dtype=np.int32),
+            deaths=np.array([row[4] for row in rows], dtype=np.int32),
+            assists=np.array([row[5] for row in rows], dtype=np.int32),
+            gold=np.array([row[6] for row in rows], dtype=np.int32),
+            damage=np.array([row[7] for row in rows], dtype=np.int32),
+            cs=np.array([row[8] for row in rows], dtype=np.int32),
+            champion=np.array(champions, dtype=np.int16),
+            posistion=np.array(posistions, dtype=np.int8),
+        )
+        for name, values in new_columns.items():
+            setattr(self, name, np.concatenate([getattr(self, name), values]))
+        # Ingested games may be older than the loaded ones
+        order = np.argsort(self.game_end, kind="stable")
+        for name in new_columns:
+            setattr(self, name, getattr(self, name)[order])
+
+    def arrays(self) -> dict:
+        """All columns at the same moment, merged with the pending rows"""
+        with _lock:
+            self.merge()
+            return dict(
+                game_end=self.game_end,
+                win=self.win,
+                kills=self.kills,
+                deaths=self.deaths,
+                assists=self.assists,
+                gold=self.gold,
+                damage=self.damage,
+                cs=self.cs,
+                champion=self.champion,
+                posistion=self.posistion,
+            )
+
+
+# puuid -> SummonerColumns, least recently used first
+_cache = OrderedDict()
+# puuid -> rows ingested while the columns are being loaded from database
+_loading = {}
+
+
+def get_columns(puuid: str) -> SummonerColumns:
+    """Columns of a summoner, loaded from database once and kept in a LRU cache"""
+    with _lock:
+        columns = _cache.get(puuid)
+        # Matches ingested by backfill.py or worker.py do not reach this process
+        if (
+            columns is not None
+            and time.time() - columns.loaded_at > gv.ANALYTICS_CACHE_TTL
+        ):
+            del _cache[puuid]
+            columns = None
+        if columns is not None:
+            _cache.move_to_end(puuid)
+            return columns
+        _loading.setdefault(puuid, [])
+
+    try:
+        columns = SummonerColumns(dbo.get_summoner_match_rows(puuid))
+    except Exception:
+        with _lock:
+            _loading.pop(puuid, None)
+        raise
+    with _lock:
+        # Matches ingested during the read may not be in it, duplicates are skipped
+        for row in _loading.pop(puuid, []):
+            columns.add(row)
+        # Another thread may have loaded it meanwhile, keep the first one
+        columns = _cache.setdefault(puuid, columns)
+        _cache.move_to_end(puuid)
+        while len(_cache) > gv.ANALYTICS_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return columns
+
+
+def add_match(api_result: dict) -> None:
+    """Extend the cached summoners who played in a match just ingested"""
+    # Remakes are not counted, same as sp_check_is_win
+    if api_result["info"]["gameDuration"] <= 210:
+        return
+    match_id = api_result["metadata"]["matchId"]
+    game_end = datetime.fromtimestamp(api_result["info"]["gameEndTimestamp"] / 1000.0)
+    with _lock:
+        for player_data in api_result["info"]["participants"]:
+            row = (
+                match_id,
+                game_end,
+                player_data["win"],
+                player_data["kills"],
+                player_data["deaths"],
+                player_data["assists"],
+                player_data["goldEarned"],
+                player_data["totalDamageDealtToChampions"],
+                player_data["totalMinionsKilled"],
+                player_data["championName"],
+                player_data["individualPosition"],
+            )
+            if player_data["puuid"] in _cache:
+                _cache[player_data["puuid"]].add(row)
+            elif player_data["puuid"] in _loading:
+                _loading[player_data["puuid"]].append(row)
+
+
+def rolling_sum(values: np.ndarray, window: int) -> np.ndarray:
+    """Sum of each window of values, len(values) - window + 1 results"""
+    sums = np.cumsum(values, dtype=np.float64)
+    sums[window:] = sums[window:] - sums[:-window]
+    return sums[window - 1 :]
+
+
+def bar(value: float, max_value: float, width: int = 20) -> str:
+    if max_value <= 0:
+        return ""
+    return "█" * int(round(value / max_value * width))
+
+
+def render_series(
+    game_end: np.ndarray, values: np.ndarray, window: int, unit: str
+) -> List[str]:
+    """Lines of evenly spaced points of a rolling series"""
+    lines = []
+    max_value = float(values.max())
+    indexes = np.unique(np.linspace(0, len(values) - 1, gv.TREND_POINTS).astype(int))
+    for index in indexes:
+        end = str(game_end[index + window - 1].astype("datetime64[D]"))
+        value = float(values[index])
+        lines.append(
+            f"{index + 1:>5}-{index + window:<5} {end} {value:7.2f}{unit} {bar(value, max_value)}"
+        )
+    return lines
+
+
+def get_trend_str(
+    columns: SummonerColumns, metric: str, window: int, champion: str = None
+) -> str:
+    """Vectorized trend of a metric over the games in columns"""
+    arrays = columns.arrays()
+    mask = np.ones(len(arrays["game_end"]), dtype=bool)
+    if champion is not None:
+        with _lock:
+            code = champion_codes.get(champion)
+        if code is None:
+            return f"No game played with {champion}"
+        mask = arrays["champion"] == code
+    games = int(mask.sum())
+    if games == 0:
+        return "No game found"
+
+    game_end = arrays["game_end"][mask]
+    win = arrays["win"][mask]
+    kills = arrays["kills"][mask]
+    deaths = arrays["deaths"][mask]
+    assists = arrays["assists"][mask]
+    gold = arrays["gold"][mask]
+    damage = arrays["damage"][mask]
+    lines = [f"Games: {games}"]
+
+    if metric in ["win_rate", "kda", "damage_per_gold"]:
+        window = min(window, games)
+        if metric == "win_rate":
+            values = rolling_sum(win, window) * 100 / window
+            unit = "%"
+        elif metric == "kda":
+            values = rolling_sum(kills + assists, window) / np.maximum(
+                rolling_sum(deaths, window), 1
+            )
+            unit = ""
+        else:
+            values = rolling_sum(damage, window) / np.maximum(
+                rolling_sum(gold, window), 1
+            )
+            unit = ""
+        lines.append(f"Rolling {metric} over {window} games")
+        lines.extend(render_series(game_end, values, window, unit))
+
+    elif metric == "hour_of_day":
+        # game_end is in local time, as saved by core.ingest_match
+        hours = game_end.astype("datetime64[h]").astype(np.int64) % 24
+        played = np.bincount(hours, minlength=24)
+        won = np.bincount(hours, weights=win, minlength=24)
+        lines.append("Hour  Games  Win rate")
+        for hour in np.flatnonzero(played):
+            win_rate = won[hour] * 100 / played[hour]
+            lines.append(
+                f"{hour:02d}:00 {played[hour]:>5}  {win_rate:5.1f}% {bar(win_rate, 100)}"
+            )
+
+    elif metric == "streak":
+        # Start of each run of wins or losses
+        starts = np.flatnonzero(np.concatenate([[True], win[1:] != win[:-1]]))
+        lengths = np.diff(np.append(starts, len(win)))
+        run_is_win = win[starts]
+        current = "win" if run_is_win[-1] else "lose"
+        lines.append(f"Current streak: {lengths[-1]} {current}")
+        lines.append(f"Longest win streak: {int(lengths[run_is_win].max(initial=0))}")
+        lines.append(f"Longest lose streak: {int(lengths[~run_is_win].max(initial=0))}")
+
+    return "\n".join(lines)
@@ -0,0 +1,163 @@
+"""Load the ranked history of summoners into database without the bot
+
+Usage:
+    python backfill.py SUMMONER [SUMMONER ...] --start 2023-01-01 [--end 2023-06-01]
+        [--region4 tw2 --region5 sea]
+
+Progress is saved to a checkpoint file after every page of 100 match ids,
+running the same command again continues from the last finished page.
+"""
+
+import argparse
+import json
+import os
+import time
+from datetime import datetime
+from typing import List
+import pytz
+import call_api
+import core
+import database_operations as dbo
+import global_variables as gv
+
+
+def load_checkpoint(path: str) -> dict:
+    """Load the checkpoint file, empty if not exist"""
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as file:
+        return json.load(file)
+
+
+def save_checkpoint(path: str, checkpoint: dict) -> None:
+    """Write the checkpoint file, replace the old one only after fully written"""
+    temp_path = path + ".tmp"
+    with open(temp_path, "w", encoding="utf-8") as file:
+        json.dump(checkpoint, file, indent=2)
+    os.replace(temp_path, path)
+
+
+def to_utc(date_str: str) -> datetime:
+    """Convert a YYYY-MM-DD date in local timezone to UTC datetime"""
+    local = pytz.timezone(gv.local_timezone)
+    local_time = local.localize(datetime.strptime(date_str, "%Y-%m-%d"), is_dst=None)
+    return local_time.astimezone(pytz.utc)
+
+
+def backfill_summoner(
+    summoner_name: str,
+    start_date: str,
+    end_date: str,
+    checkpoint: dict,
+    checkpoint_path: str,
+) -> int:
+    """Ingest every ranked match of a summoner in the period, return number of new matches"""
+    # puuid and match ids are only valid in the same regions
+    key = f"{gv.region_v4}|{gv.region_v5}|{summoner_name}|{start_date}|{end_date or 'now'}"
+    if key not in checkpoint:
+        # Fix the end of period on the first run so that resuming gets the same pages
+        if end_date is None:
+            end_timestamp = int(time.time())
+        else:
+            end_timestamp = int(to_utc(end_date).timestamp())
+        checkpoint[key] = {"page": 0, "done": False, "end_timestamp": end_timestamp}
+    progress = checkpoint[key]
+    start_time = to_utc(start_date)
+    end_time = datetime.fromtimestamp(progress["end_timestamp"], pytz.utc)
+    if progress["done"]:
+        core.log(f"{summoner_name} already done, skipped")
+        return 0
+
+    # Get summoner's puuid, create new summoner in database if not exist
+    if "puuid" not in progress:
+        details = core.get_summoner_details(summoner_name)
+        if not dbo.summoner_exists(details["puuid"]):
+            dbo.add_summoner(summoner_name, details["id"], details["puuid"])
+        progress["puuid"] = details["puuid"]
+        save_checkpoint(checkpoint_path, checkpoint)
+    puuid = progress["puuid"]
+
+    ingested = 0
+    started_at = time.time()
+    calls_at_start = call_api.call_count
+    while True:
+        page = progress["page"]
+        match_id_list = core.get_solo_ranked_match_ids(
+            puuid, start_time, end_time, start=page * 100
+        )
+        ingested += core.ingest_matches(dbo.get_match_ids_not_in_db(match_id_list))
+
+        # Riot Match-V5 API can at most reply 100 match ids in one call
+        progress["page"] = page + 1
+        progress["done"] = len(match_id_list) < 100
+        save_checkpoint(checkpoint_path, checkpoint)
+
+        elapsed = max(time.time() - started_at, 1e-6)
+        calls = call_api.call_count - calls_at_start
+        core.log(
+            f"{summoner_name} page {page + 1}: {len(match_id_list)} match ids, "
+            f"{ingested} new matches, {ingested / elapsed:.2f} matches/s, "
+            f"{calls / elapsed:.2f} calls/s"
+        )
+        if progress["done"]:
+            return ingested
+
+
+def main(argv: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(description="Backfill ranked matches to database")
+    parser.add_argument("summoners", nargs="+", help="Names of the summoners")
+    parser.add_argument("--start", required=True, help="First day, YYYY-MM-DD")
+    parser.add_argument("--end", help="Day after the last day, YYYY-MM-DD, default now")
+    parser.add_argument(
+        "--region4",
+        default=gv.region_v4,
+        choices=gv.REGION_V4_LIST,
+        help="Region for Riot V4 API",
+    )
+    parser.add_argument(
+        "--region5",
+        default=gv.region_v5,
+        choices=gv.REGION_V5_LIST,
+        help="Region for Riot V5 API",
+    )
+    parser.add_argument(
+        "--budget-share",
+        type=float,
+        default=gv.BACKFILL_BUDGET_SHARE,
+        help="Share of the API rate limits to use, in (0, 1]",
+    )
+    parser.add_argument(
+        "--checkpoint",
+        default=gv.BACKFILL_CHECKPOINT,
+        help="File to save progress for resuming",
+    )
+    parser.add_argument(
+        "--distributed",
+        action="store_true",
+        help="Share the rate limit and match ingestion with worker.py processes",
+    )
+    args = parser.parse_args(argv)
+
+    call_api.set_budget_share(args.budget_share)
+    gv.region_v4 = args.region4
+    gv.region_v5 = args.region5
+    if args.distributed:
+        gv.distributed = True
+    checkpoint = load_checkpoint(args.checkpoint)
+    total = 0
+    started_at = time.time()
+    for summoner_name in args.summoners:
+        try:
+            total += backfill_summoner(
+                summoner_name, args.start, args.end, checkpoint, args.checkpoint
+            )
+        except call_api.NotFoundError:
+            # e.g. a mistyped name, do not block the others on every resume
+            core.log(f"Summoner {summoner_name} not found in {gv.region_v4}, skipped")
+
+    elapsed = time.time() - started_at
+    core.log(f"Backfill finished, {total} new matches in {elapsed:.0f}s")
+
+
+if __name__ == "__main__":
+    main()
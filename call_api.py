@@ -1,17 +1,302 @@
+import contextvars
+import random
+import threading
 import time
+from collections import deque
+from urllib.parse import urlparse
 import requests
+import database_operations as dbo
+import global_variables as gv
+
+# Share of gv.RIOT_RATE_LIMITS this process may use
+budget_share = 1.0
+# Number of calls sent since start, for throughput reports
+call_count = 0
+# Timestamps of calls within the longest rate limit window
+_call_times = deque()
+# No call is sent before this timestamp, set by Retry-After of 429
+_blocked_until = 0.0
+_lock = threading.Lock()
+# Who the calls of this thread are made for, e.g. a guild, see run_as
+budget_key = contextvars.ContextVar("budget_key", default=None)
+# budget key -> timestamps of its calls within the longest rate limit window
+_calls_by_key = {}
+# (url, params) -> timestamp when the cached 404 expires
+_not_found_cache = {}
+# host -> CircuitBreaker
+_breakers = {}
+
+
+class RiotApiError(Exception):
+    """Riot API replied with an unexpected status"""
+
+    def __init__(self, status_code: int, url: str, message: str = None):
+        self.status_code = status_code
+        self.url = url
+        if message is None:
+            message = f"Error: {str(status_code)}"
+        super().__init__(message)
+
+
+class NotFoundError(RiotApiError):
+    """404, e.g. the summoner name does not exist"""
+
+
+class TransientError(RiotApiError):
+    """Failure that may pass if the call is tried again later"""
+
+
+class RateLimitError(TransientError):
+    """429 after all retries"""
+
+
+class ServerError(TransientError):
+    """5xx or connection failure after all retries"""
+
+
+class CircuitOpenError(TransientError):
+    """The host failed too many times recently, call is not sent"""
+
+
+class CircuitBreaker:
+    """Fail fast for a host after consecutive failures, retry one call after cooldown"""
+
+    def __init__(self, host: str):
+        self.host = host
+        self.failures = 0
+        self.opened_at = None
+        self.lock = threading.Lock()
+
+    def before_call(self, url: str) -> None:
+        with self.lock:
+            if self.opened_at is None:
+                return
+            if time.time() - self.opened_at < gv.API_CIRCUIT_COOLDOWN:
+                raise CircuitOpenError(
+                    None, url, f"Riot API {self.host} is unavailable, try again later"
+                )
+            # Half open, let this call through and keep failing fast for others
+            self.opened_at = time.time()
+
+    def record_success(self) -> None:
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self) -> None:
+        with self.lock:
+            self.failures += 1
+            if self.failures >= gv.API_CIRCUIT_THRESHOLD:
+                self.opened_at = time.time()
+
+
+def get_breaker(url: str) -> CircuitBreaker:
+    """Get the circuit breaker of the host of url"""
+    host = urlparse(url).netloc
+    with _lock:
+        if host not in _breakers:
+            _breakers[host] = CircuitBreaker(host)
+        return _breakers[host]
+
+
+def set_budget_share(share: float) -> None:
+    """Limit this process to a share of the API rate limits"""
+    global budget_share
+    if not 0 < share <= 1:
+        raise ValueError("Budget share should be in (0, 1]")
+    budget_share = share
+
+
+def run_as(key: str, func, *args, **kwargs):
+    """Run func with its API calls counted for key"""
+    token = budget_key.set(key)
+    try:
+        return func(*args, **kwargs)
+    finally:
+        budget_key.reset(token)
+
+
+def recent_calls(key: str, window: float) -> int:
+    """Number of calls made for key in the last window seconds"""
+    now = time.time()
+    with _lock:
+        return sum(1 for t in _calls_by_key.get(key, ()) if t > now - window)
+
+
+def block_until(timestamp: float) -> None:
+    """Stop sending calls until timestamp"""
+    global _blocked_until
+    with _lock:
+        _blocked_until = max(_blocked_until, timestamp)
+
+
+def record_key_call(now: float, longest_window: float) -> None:
+    """Count a call for the current budget key, called with _lock held"""
+    key = budget_key.get()
+    if key is None:
+        return
+    key_times = _calls_by_key.setdefault(key, deque())
+    key_times.append(now)
+    while key_times[0] <= now - longest_window:
+        key_times.popleft()
+    # Forget keys without recent calls
+    for other_key in [
+        k for k, v in _calls_by_key.items() if v[-1] <= now - longest_window
+    ]:
+        del _calls_by_key[other_key]
+
+
+def wait_for_shared_budget() -> None:
+    """Block until the ledger in database, shared by all processes, allows one more call"""
+    global call_count
+    while True:
+        wait = _blocked_until - time.time()
+        if wait > 0:
+            time.sleep(wait)
+            continue
+
+        # Sliding windows over the calls of every process, all limits checked at once
+        limits = [
+            (max(1, int(limit * budget_share)), window)
+            for limit, window in gv.RIOT_RATE_LIMITS
+        ]
+        wait = dbo.acquire_rate_slot(limits)
+        if wait > 0:
+            time.sleep(wait)
+            continue
+
+        now = time.time()
+        longest_window = max(window for _, window in gv.RIOT_RATE_LIMITS)
+        with _lock:
+            _call_times.append(now)
+            call_count += 1
+            record_key_call(now, longest_window)
+        return
+
+
+def wait_for_budget() -> None:
+    """Block until one more call is allowed by every rate limit"""
+    global call_count
+    if gv.distributed:
+        wait_for_shared_budget()
+        return
+    longest_window = max(window for _, window in gv.RIOT_RATE_LIMITS)
+    while True:
+        with _lock:
+            now = time.time()
+            while len(_call_times) > 0 and _call_times[0] <= now - longest_window:
+                _call_times.popleft()
+
+            wait = _blocked_until - now
+            for limit, window in gv.RIOT_RATE_LIMITS:
+                allowed = max(1, int(limit * budget_share))
+                in_window = [t for t in _call_times if t > now - window]
+                if len(in_window) >= allowed:
+                    # Wait until the oldest of the last allowed calls leaves the window
+                    wait = max(wait, in_window[-allowed] + window - now)
+
+            if wait <= 0:
+                _call_times.append(now)
+                call_count += 1
+                record_key_call(now, longest_window)
+                return
+        time.sleep(wait)
+
+
+def export_state() -> dict:
+    """Rate limit state in a JSON friendly format for snapshot"""
+    with _lock:
+        return dict(call_times=list(_call_times), blocked_until=_blocked_until)
+
+
+def import_state(state: dict) -> None:
+    """Restore calls still inside the rate limit windows, so a restart does not burst"""
+    global _blocked_until
+    now = time.time()
+    longest_window = max(window for _, window in gv.RIOT_RATE_LIMITS)
+    call_times = [
+        t
+        for t in state.get("call_times", [])
+        if isinstance(t, (int, float)) and now - longest_window < t <= now
+    ]
+    blocked_until = state.get("blocked_until", 0.0)
+    with _lock:
+        merged = sorted(set(_call_times).union(call_times))
+        _call_times.clear()
+        _call_times.extend(merged)
+        if isinstance(blocked_until, (int, float)):
+            _blocked_until = max(
+                _blocked_until, min(blocked_until, now + gv.API_BACKOFF_CAP)
+            )
+
+
+def backoff_delay(attempt: int, retry_after: str = None) -> float:
+    """Seconds to wait before retry, Retry-After if given, else capped exponential with jitter"""
+    if retry_after is not None:
+        try:
+            return float(retry_after) + random.uniform(0, gv.API_BACKOFF_BASE)
+        except ValueError:
+            pass
+    return random.uniform(0, min(gv.API_BACKOFF_CAP, gv.API_BACKOFF_BASE * 2**attempt))
+
+
+def remember_not_found(cache_key: tuple) -> None:
+    """Cache a 404 for API_NOT_FOUND_TTL seconds"""
+    now = time.time()
+    if len(_not_found_cache) >= 1000:
+        for key, expires_at in list(_not_found_cache.items()):
+            if expires_at <= now:
+                _not_found_cache.pop(key, None)
+    _not_found_cache[cache_key] = now + gv.API_NOT_FOUND_TTL
 
 
 def call(url: str, headers: dict, params: dict = None) -> list:
-    """Call api, will wait if rate limit exceeded"""
-    response = requests.get(url=url, headers=headers, params=params)
-
-    while response.status_code == 429:
-        time.sleep(1)
-        response = requests.get(url, headers=headers, params=params)
-
-    # Success
-    if response.status_code == 200:
-        return response.json()
-    else:
-        raise Exception(f"Error: {str(response.status_code)}")
+    """Call api, retry with backoff on rate limit and server errors"""
+    cache_key = (url, tuple(sorted((params or {}).items())))
+    expires_at = _not_found_cache.get(cache_key)
+    if expires_at is not None:
+        if expires_at > time.time():
+            raise NotFoundError(404, url)
+        _not_found_cache.pop(cache_key, None)
+
+    breaker = get_breaker(url)
+    error = None
+    for attempt in range(gv.API_MAX_RETRIES + 1):
+        if attempt > 0:
+            time.sleep(delay)
+        breaker.before_call(url)
+        wait_for_budget()
+
+        try:
+            response = requests.get(
+                url=url, headers=headers, params=params, timeout=gv.API_TIMEOUT
+            )
+        except requests.RequestException as e:
+            breaker.record_failure()
+            error = ServerError(None, url, f"Error: {str(e)}")
+            delay = backoff_delay(attempt)
+            continue
+
+        # Success
+        if response.status_code == 200:
+            breaker.record_success()
+            return response.json()
+
+        retry_after = response.headers.get("Retry-After")
+        if response.status_code == 404:
+            breaker.record_success()
+            remember_not_found(cache_key)
+            raise NotFoundError(404, url)
+        elif response.status_code == 429:
+            error = RateLimitError(429, url)
+            delay = backoff_delay(attempt, retry_after)
+            # Other threads share the same key, hold them as well
+            block_until(time.time() + delay)
+        elif response.status_code >= 500:
+            breaker.record_failure()
+            error = ServerError(response.status_code, url)
+            delay = backoff_delay(attempt, retry_after)
+        else:
+            raise RiotApiError(response.status_code, url)
+
+    raise error
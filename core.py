@@ -1,21 +1,169 @@
+import contextvars
 import re
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from typing import List, Tuple
 import pytz
+import analytics
 import call_api
 import database_operations as dbo
 import global_variables as gv
 
+# Hot working set, saved to and loaded from snapshot by export_state and import_state
+# (region_v4, summoner_name) -> (cached_at, summoner details)
+summoner_cache = OrderedDict()
+# (puuid, start, end) -> match ids of a finished period
+match_id_cache = OrderedDict()
+# (puuid, start, end) -> {"wins", "losses", "detailed_rows"} of a finished period
+period_result_cache = OrderedDict()
+_cache_lock = threading.Lock()
+# (region_v4, region_v5) of the check running in this thread, see run_in_regions
+regions = contextvars.ContextVar("regions", default=None)
+
+
+def get_region_v4() -> str:
+    """Region for SUMMONER-V4 and LEAGUE-V4 API of the current check"""
+    if regions.get() is not None:
+        return regions.get()[0]
+    return gv.region_v4
+
+
+def get_region_v5() -> str:
+    """Region for MATCH-V5 API of the current check"""
+    if regions.get() is not None:
+        return regions.get()[1]
+    return gv.region_v5
+
+
+def run_in_regions(region_v4: str, region_v5: str, func, *args, **kwargs):
+    """Run func with other regions than gv, e.g. a check job queued by another process"""
+    token = regions.set((region_v4, region_v5))
+    try:
+        return func(*args, **kwargs)
+    finally:
+        regions.reset(token)
+
+
+def log(text: str) -> None:
+    """Print text with the current time"""
+    now_str = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    print(f"{now_str} {text}", flush=True)
+
+
+def lookup(cache: OrderedDict, key):
+    """Get a value from a LRU cache, None if not exist"""
+    with _cache_lock:
+        if key not in cache:
+            return None
+        cache.move_to_end(key)
+        return cache[key]
+
+
+def remember(cache: OrderedDict, key, value, max_size: int) -> None:
+    """Put a value to a LRU cache, drop the least recently used if full"""
+    with _cache_lock:
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > max_size:
+            cache.popitem(last=False)
+
+
+def export_state() -> dict:
+    """Caches in a JSON friendly format for snapshot"""
+    with _cache_lock:
+        return dict(
+            summoners=[
+                [region, name, value[0], value[1]]
+                for (region, name), value in summoner_cache.items()
+            ],
+            match_id_windows=[[list(key), ids] for key, ids in match_id_cache.items()],
+            period_results=[
+                [list(key), result] for key, result in period_result_cache.items()
+            ],
+        )
+
+
+def is_window_key(key) -> bool:
+    return (
+        isinstance(key, list)
+        and len(key) == 3
+        and isinstance(key[0], str)
+        and isinstance(key[1], int)
+        and isinstance(key[2], int)
+    )
+
+
+def import_state(state: dict) -> int:
+    """Fill caches from snapshot, invalid and expired entries are skipped, return entries loaded"""
+    loaded = 0
+    now = time.time()
+    for region, name, cached_at, details in state.get("summoners", []):
+        if (
+            isinstance(region, str)
+            and isinstance(name, str)
+            and isinstance(cached_at, (int, float))
+            and now - cached_at < gv.SUMMONER_CACHE_TTL
+            and isinstance(details, dict)
+            and isinstance(details.get("puuid"), str)
+            and isinstance(details.get("id"), str)
+            and lookup(summoner_cache, (region, name)) is None
+        ):
+            remember(
+                summoner_cache,
+                (region, name),
+                (cached_at, details),
+                gv.SUMMONER_CACHE_SIZE,
+            )
+            loaded += 1
+
+    for key, ids in state.get("match_id_windows", []):
+        if (
+            is_window_key(key)
+            and isinstance(ids, list)
+            and all(isinstance(id, str) for id in ids)
+        ):
+            remember(match_id_cache, tuple(key), ids, gv.PERIOD_CACHE_SIZE)
+            loaded += 1
+
+    for key, result in state.get("period_results", []):
+        if (
+            is_window_key(key)
+            and isinstance(result, dict)
+            and isinstance(result.get("wins"), int)
+            and isinstance(result.get("losses"), int)
+            and isinstance(result.get("detailed_rows"), (list, type(None)))
+        ):
+            remember(period_result_cache, tuple(key), result, gv.PERIOD_CACHE_SIZE)
+            loaded += 1
+
+    return loaded
+
+
+def get_cached_summoner_details(summoner_name: str) -> dict:
+    """Get summoner details from cache, call API if not cached or expired"""
+    # The same name is another summoner in another region
+    key = (get_region_v4(), summoner_name)
+    cached = lookup(summoner_cache, key)
+    if cached is not None and time.time() - cached[0] < gv.SUMMONER_CACHE_TTL:
+        return cached[1]
+
+    response = get_summoner_details(summoner_name)
+    details = {"puuid": response["puuid"], "id": response["id"]}
+    remember(summoner_cache, key, (time.time(), details), gv.SUMMONER_CACHE_SIZE)
+    return details
+
 
 def get_summoner_details(summoner_name: str) -> dict:
     """Get summoner puuid by name"""
-    url = f"https://{gv.region_v4}.api.riotgames.com/lol/summoner/v4/summoners/by-name/{summoner_name}"
+    url = f"https://{get_region_v4()}.api.riotgames.com/lol/summoner/v4/summoners/by-name/{summoner_name}"
     headers = {"X-Riot-Token": gv.RIOT_API_KEY}
     return call_api.call(url, headers)
 
 
 def get_solo_ranked_match_ids(
-    puuid: str, start_time: datetime, end_time: datetime
+    puuid: str, start_time: datetime, end_time: datetime, start: int = 0
 ) -> List[str]:
     """Get list of match ids by the summoner name and a period of time"""
     # Convert datetime objects to timestamps
@@ -23,7 +171,7 @@ def get_solo_ranked_match_ids(
     end_time: int = int(end_time.timestamp())
 
     # Make a request to the Riot API to get match history
-    url = f"https://{gv.region_v5}.api.riotgames.com/lol/match/v5/matches/by-puuid/{puuid}/ids"
+    url = f"https://{get_region_v5()}.api.riotgames.com/lol/match/v5/matches/by-puuid/{puuid}/ids"
     # 420 = Solo rank
     headers = {"X-Riot-Token": gv.RIOT_API_KEY}
     params = {
@@ -31,6 +179,7 @@ def get_solo_ranked_match_ids(
         "type": "ranked",
         "startTime": start_time,
         "endTime": end_time,
+        "start": start,
         "count": 100,
     }
 
@@ -39,7 +188,7 @@ def get_solo_ranked_match_ids(
 
 def get_match_details(match_id: str) -> dict:
     """Get match details by match id"""
-    url = f"https://{gv.region_v5}.api.riotgames.com/lol/match/v5/matches/{match_id}"
+    url = f"https://{get_region_v5()}.api.riotgames.com/lol/match/v5/matches/{match_id}"
     headers = {"X-Riot-Token": gv.RIOT_API_KEY}
 
     response = call_api.call(url, headers)
@@ -48,7 +197,7 @@ def get_match_details(match_id: str) -> dict:
 
 def get_solo_rank_lp(summoner_id: str) -> dict:
     """Get the current solo rank and LP by summoner id"""
-    url = f"https://{gv.region_v4}.api.riotgames.com/lol/league/v4/entries/by-summoner/{summoner_id}"
+    url = f"https://{get_region_v4()}.api.riotgames.com/lol/league/v4/entries/by-summoner/{summoner_id}"
     headers = {"X-Riot-Token": gv.RIOT_API_KEY}
 
     result = call_api.call(url, headers)
@@ -79,7 +228,7 @@ def get_solo_rank_lp(summoner_id: str) -> dict:
 
 def get_game_end_timestamp(match_id: str) -> int:
     """Get the timestamp of gameEndTimestamp by match id, return timestamp in seconds"""
-    url = f"https://{gv.region_v5}.api.riotgames.com/lol/match/v5/matches/{match_id}"
+    url = f"https://{get_region_v5()}.api.riotgames.com/lol/match/v5/matches/{match_id}"
     headers = {"X-Riot-Token": gv.RIOT_API_KEY}
 
     response = call_api.call(url, headers)
@@ -88,8 +237,116 @@ def get_game_end_timestamp(match_id: str) -> int:
     return timestamp
 
 
-def blocking_check(summoner_name: str, period: str, mode: str) -> Tuple[bool, str]:
-    """Long function, return status and message"""
+def ingest_match(match_id: str) -> bool:
+    """Get a match from Riot API and insert it to database, return False if skipped"""
+    result = get_match_details(match_id)
+    # match_detail (a row in match_detail_list) should be:
+    # [match_id, region_v5, gameStartTimeStamp, gameMode, gameType, gameDuration, gameEndTimestamp, queueId, platformId, game_end_datetime]
+    # Where item in snake case is from python and camel case is from Riot's API
+    # Timestamps here are in milliseconds (From Riot Match-V5 API)
+
+    # Avoid bug caused by empty game returned by Riot
+    # e.g. TW2_92598712
+    if len(result["info"]["participants"]) == 0:
+        log(f"Error on match_id {match_id}")
+        return False
+    match_detail = [match_id, get_region_v5()]
+    # gameStartTimestamp
+    match_detail.append(result["info"]["gameStartTimestamp"])
+    # gameMode
+    match_detail.append(result["info"]["gameMode"])
+    # gameType
+    match_detail.append(result["info"]["gameType"])
+    # gameDuration
+    match_detail.append(result["info"]["gameDuration"])
+    # gameEndTimestamp
+    match_detail.append(result["info"]["gameEndTimestamp"])
+    # gameEndedInEarlySurrender
+    early_surrender = result["info"]["participants"][0]["gameEndedInSurrender"]
+    match_detail.append(early_surrender)
+    # queueId
+    match_detail.append(result["info"]["queueId"])
+    # platformId
+    match_detail.append(result["info"]["platformId"])
+    # Calculate game_end_datetime GMT in string
+    game_end = result["info"]["gameEndTimestamp"]
+    # Translate to timestamp in seconds
+    game_end_datetime = datetime.fromtimestamp(game_end / 1000.0)
+    match_detail.append(game_end_datetime.strftime("%Y-%m-%d %H:%M:%S"))
+
+    # Insert the row to table matches and player's details to match_players table
+    dbo.insert_match(match_detail, result)
+    analytics.add_match(result)
+
+    return True
+
+
+def ingest_matches(match_id_list: List[str]) -> int:
+    """Ingest matches not in database, return number of matches inserted by this process"""
+    if not gv.distributed:
+        return sum(1 for match_id in match_id_list if ingest_match(match_id))
+
+    # Other workers may be getting the same matches, only one calls Riot API for each
+    claimer = f"{gv.WORKER_ID}:{threading.get_ident()}"
+    ingested = 0
+    claimed_by_others = []
+    for match_id in match_id_list:
+        if dbo.claim_match(match_id, claimer, gv.MATCH_CLAIM_SECONDS):
+            if ingest_match(match_id):
+                ingested += 1
+        else:
+            claimed_by_others.append(match_id)
+
+    # Wait for other workers, take over the matches when their claims expire
+    deadline = time.time() + gv.MATCH_CLAIM_SECONDS
+    while len(claimed_by_others) > 0 and time.time() < deadline:
+        time.sleep(gv.JOB_POLL_INTERVAL)
+        claimed_by_others = dbo.get_match_ids_not_in_db(claimed_by_others)
+    for match_id in claimed_by_others:
+        if dbo.claim_match(match_id, claimer, gv.MATCH_CLAIM_SECONDS):
+            if ingest_match(match_id):
+                ingested += 1
+
+    return ingested
+
+
+def get_period_match_ids(
+    puuid: str, start_time: datetime, end_time: datetime
+) -> List[str]:
+    """Get all solo ranked match ids of a period, more than 100 if needed"""
+    match_id_list = []
+    result = get_solo_ranked_match_ids(puuid, start_time, end_time)
+    match_id_list.extend(result)
+    # Continue using the api with different time params if the length of list is 100
+    # Riot Match-V5 API can at most reply 100 match ids in one call
+    while len(result) == 100:
+        last_match_in_list = result[-1]
+        # Get the gameEndTimestamp by Match-V5 API
+        # API for a specific match uses timestamp in milliseconds,
+        # but timestamp for list of match ids uses timestamp in seconds
+        end_time_extend = get_game_end_timestamp(last_match_in_list)
+        # Convert to datetime
+        section_end_time = datetime.fromtimestamp(end_time_extend)
+        result = get_solo_ranked_match_ids(puuid, start_time, section_end_time)
+        match_id_list.extend(result)
+
+    return match_id_list
+
+
+def reraise_transient(e: Exception, raise_transient: bool) -> None:
+    """Raise e again if it may pass on retry and the caller retries, e.g. worker.py"""
+    if raise_transient and isinstance(e, call_api.TransientError):
+        raise e
+
+
+def blocking_check(
+    summoner_name: str, period: str, mode: str, raise_transient: bool = False
+) -> Tuple[bool, str, List[dict]]:
+    """Long function, return status, message and the rows for detailed mode
+
+    With raise_transient, Riot API failures that may pass on retry are raised
+    instead of returned as a message.
+    """
     # Get the start_time according to period
     now = datetime.now()
     today = datetime.today()
@@ -133,14 +390,14 @@ def blocking_check(summoner_name: str, period: str, mode: str) -> Tuple[bool, st
         match = re.search(pattern, period)
         days = int(match.group(1))
         if days < 1:
-            return False, f"Please input correct number of days (>0)"
+            return False, f"Please input correct number of days (>0)", []
         if days > 150:
             # My API key does not allow much calls at the same time
             # Let 150 be the end
-            return False, f"Please search at most 150 days"
+            return False, f"Please search at most 150 days", []
         start_time = now - timedelta(days=days)
     else:
-        return False, f"Invaild period"
+        return False, f"Invaild period", []
 
     # Convert to UTC for Riot API
     local = pytz.timezone(gv.local_timezone)
@@ -151,14 +408,17 @@ def blocking_check(summoner_name: str, period: str, mode: str) -> Tuple[bool, st
 
     # Get summoner's puuid
     try:
-        details = get_summoner_details(summoner_name)
+        details = get_cached_summoner_details(summoner_name)
         puuid: str = details["puuid"]
         summoner_id: str = details["id"]
+    except call_api.NotFoundError:
+        return False, f"Summoner {summoner_name} not found", []
     except Exception as e:
-        return False, f"{str(e)} when getting summoner id"
+        reraise_transient(e, raise_transient)
+        return False, f"{str(e)} when getting summoner id", []
 
     if puuid is None:
-        return False, f"Error getting puuid"
+        return False, f"Error getting puuid", []
 
     # Check if summoner exists in database, create new if not exist
     try:
@@ -167,84 +427,52 @@ def blocking_check(summoner_name: str, period: str, mode: str) -> Tuple[bool, st
             dbo.add_summoner(summoner_name, summoner_id, puuid)
             summoner_exist = True
     except Exception as e:
-        return False, f"Failed to collect database data, {str(e)}"
+        return False, f"Failed to collect database data, {str(e)}", []
+
+    # Results of a finished period do not change, reuse them if cached
+    window = (puuid, int(start_time.timestamp()), int(end_time.timestamp()))
+    finished = end_time.timestamp() < time.time() - gv.FINISHED_PERIOD_MARGIN
+    period_result = None
+    if finished:
+        period_result = lookup(period_result_cache, window)
+    if period_result is None or (
+        mode == "detailed" and period_result["detailed_rows"] is None
+    ):
+        # Get the list of match ids in the period of time
+        match_id_list = None
+        if finished:
+            match_id_list = lookup(match_id_cache, window)
+        if match_id_list is None:
+            try:
+                match_id_list = get_period_match_ids(puuid, start_time, end_time)
+            except Exception as e:
+                reraise_transient(e, raise_transient)
+                return False, f"{str(e)} when getting match ids", []
+            if finished:
+                remember(match_id_cache, window, match_id_list, gv.PERIOD_CACHE_SIZE)
+
+        if match_id_list is None:
+            return False, f"Error getting match_id_list", []
+        elif len(match_id_list) == 0:
+            return False, f"No match is played in the time period", []
+
+        # Check if the matches exist in db
+        try:
+            match_list_not_in_db = dbo.get_match_ids_not_in_db(match_id_list)
+            ingest_matches(match_list_not_in_db)
+        except Exception as e:
+            reraise_transient(e, raise_transient)
+            return False, f"{str(e)} when getting match details", []
 
-    # Get the list of match ids in the period of time
-    try:
-        match_id_list = []
-        result = get_solo_ranked_match_ids(puuid, start_time, end_time)
-        match_id_list.extend(result)
-        # Continue using the api with different time params if the length of list is 100
-        # Riot Match-V5 API can at most reply 100 match ids in one call
-        while len(result) == 100:
-            last_match_in_list = result[-1]
-            # Get the gameEndTimestamp by Match-V5 API
-            # API for a specific match uses timestamp in milliseconds,
-            # but timestamp for list of match ids uses timestamp in seconds
-            end_time_extend = get_game_end_timestamp(last_match_in_list)
-            # Convert to datetime
-            section_end_time = datetime.fromtimestamp(end_time_extend)
-            result = get_solo_ranked_match_ids(puuid, start_time, section_end_time)
-            match_id_list.extend(result)
-    except Exception as e:
-        return False, f"{str(e)} when getting match ids"
-
-    if match_id_list is None:
-        return False, f"Error getting match_id_list"
-    elif len(match_id_list) == 0:
-        return False, f"No match is played in the time period"
-
-    # Check if the matches exist in db
-    match_list_not_in_db = dbo.get_match_ids_not_in_db(match_id_list)
-
-    for match_id in match_list_not_in_db:
-        result = get_match_details(match_id)
-        # match_detail (a row in match_detail_list) should be:
-        # [match_id, region_v5, gameStartTimeStamp, gameMode, gameType, gameDuration, gameEndTimestamp, queueId, platformId, game_end_datetime]
-        # Where item in snake case is from python and camel case is from Riot's API
-        # Timestamps here are in milliseconds (From Riot Match-V5 API)
-
-        # Avoid bug caused by empty game returned by Riot
-        # e.g. TW2_92598712
-        if len(result["info"]["participants"]) == 0:
-            now_str = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            print(f"{now_str} Error on match_id {match_id}")
-            continue
-        match_detail = [match_id, gv.region_v5]
-        # gameStartTimestamp
-        match_detail.append(result["info"]["gameStartTimestamp"])
-        # gameMode
-        match_detail.append(result["info"]["gameMode"])
-        # gameType
-        match_detail.append(result["info"]["gameType"])
-        # gameDuration
-        match_detail.append(result["info"]["gameDuration"])
-        # gameEndTimestamp
-        match_detail.append(result["info"]["gameEndTimestamp"])
-        # gameEndedInEarlySurrender
-        early_surrender = result["info"]["participants"][0]["gameEndedInSurrender"]
-        match_detail.append(early_surrender)
-        # queueId
-        match_detail.append(result["info"]["queueId"])
-        # platformId
-        match_detail.append(result["info"]["platformId"])
-        # Calculate game_end_datetime GMT in string
-        game_end = result["info"]["gameEndTimestamp"]
-        # Translate to timestamp in seconds
-        game_end_datetime = datetime.fromtimestamp(game_end / 1000.0)
-        match_detail.append(game_end_datetime.strftime("%Y-%m-%d %H:%M:%S"))
-
-        # Insert the row to table matches
-        dbo.insert_to_matches(match_detail)
-
-        # Insert player's details of this match to match_players table
-        dbo.insert_to_match_players(result)
-
-    # Calculate the result for displaying
-    try:
-        wins, losses = dbo.count_win_lose(match_id_list, puuid)
-    except Exception as e:
-        return False, f"{str(e)} when getting number of win and losses"
+        # Calculate the result for displaying
+        try:
+            wins, losses = dbo.count_win_lose(match_id_list, puuid)
+        except Exception as e:
+            return False, f"{str(e)} when getting number of win and losses", []
+        period_result = {"wins": wins, "losses": losses, "detailed_rows": None}
+
+    wins = period_result["wins"]
+    losses = period_result["losses"]
     games = wins + losses
 
     # Calculate win rate in selected period
@@ -257,7 +485,8 @@ def blocking_check(summoner_name: str, period: str, mode: str) -> Tuple[bool, st
     try:
         profile_dict = get_solo_rank_lp(summoner_id)
     except Exception as e:
-        return False, f"{str(e)} when getting rank and lp"
+        reraise_transient(e, raise_transient)
+        return False, f"{str(e)} when getting rank and lp", []
 
     # Calculate the total win rate
     total_wins = profile_dict["total_wins"]
@@ -270,14 +499,18 @@ def blocking_check(summoner_name: str, period: str, mode: str) -> Tuple[bool, st
     else:
         total_win_rate = "0%"
 
-    # Add detailed content
-    if mode == "normal":
-        detailed_str = ""
-    elif mode == "detailed":
-        try:
-            detailed_str = get_detailed_str(puuid, match_id_list)
-        except Exception as e:
-            detailed_str = f"Failed to get detail: {str(e)}"
+    # Collect detailed content, rendered later by render_summary_pages
+    detailed_rows = []
+    detailed_str = ""
+    if mode == "detailed":
+        if period_result["detailed_rows"] is None:
+            try:
+                period_result["detailed_rows"] = get_detailed_rows(puuid, match_id_list)
+            except Exception as e:
+                detailed_str = f"\n\nFailed to get detail: {str(e)}"
+        detailed_rows = period_result["detailed_rows"] or []
+    if finished:
+        remember(period_result_cache, window, period_result, gv.PERIOD_CACHE_SIZE)
 
     # Display details on chat
     message = f"""Player: {summoner_name}
@@ -294,52 +527,93 @@ Win rate: {win_rate}
 Total wins: {str(total_wins)}
 Total losses: {str(total_losses)}
 Total win rate: {total_win_rate}{detailed_str}"""
-    return True, message
+    return True, message, detailed_rows
 
 
-def get_detailed_str(puuid: str, match_id_list: List[str]) -> str:
-    """Get the detailed string for !check"""
-    # Header
-    result = "\n\n=== Details ===\n"
-    # Content
-    index = 1
+def blocking_trend(
+    summoner_name: str, metric: str, window: int, champion: str = None
+) -> str:
+    """Get the trend message of a summoner for /trend"""
+    if metric not in analytics.TREND_METRICS:
+        return f"Invaild metric"
+    try:
+        puuid = get_cached_summoner_details(summoner_name)["puuid"]
+    except Exception as e:
+        return f"{str(e)} when getting summoner id"
 
-    summary_dict = {"posistion_played": set(), "champion_played": set()}
+    try:
+        columns = analytics.get_columns(puuid)
+    except Exception as e:
+        return f"Failed to collect database data, {str(e)}"
 
+    header = f"Player: {summoner_name}\nTrend: {metric}"
+    if champion is not None:
+        header += f" on {champion}"
+    return header + "\n\n" + analytics.get_trend_str(columns, metric, window, champion)
+
+
+def get_detailed_rows(puuid: str, match_id_list: List[str]) -> List[dict]:
+    """Get the details of every game in match_id_list from database"""
+    rows = []
     for match_id in match_id_list:
-        # Get details in a game
         # KDA, champion, posistion, cs, gold, damage, gold/damage
         details: dict = dbo.get_details(match_id, puuid)
         if details["posistion"] == "UTILITY":
             details["posistion"] = "SUPPORT"
+        rows.append(details)
+
+    return rows
+
+
+def render_summary_pages(message: str, detailed_rows: List[dict]) -> List[str]:
+    """Render the result of blocking_check and the summary of detailed rows"""
+    if len(detailed_rows) > 0:
+        message += get_summary_str(detailed_rows)
+    return split_string(message, 1950)
+
+
+def count_game_pages(detailed_rows: List[dict]) -> int:
+    """Number of pages needed to show every game in detailed_rows"""
+    return -(-len(detailed_rows) // gv.GAMES_PER_PAGE)
 
-        if details["win"]:
-            win_lose = "WIN ✅"
-        else:
-            win_lose = "Lose ❌"
-        end_time = details["game_end"][:-4]
-        champion = details["champion"]
-        posistion = details["posistion"]
-        kills = int(details["kills"])
-        deaths = int(details["deaths"])
-        assists = int(details["assists"])
-        kda = f"{str(kills)}/{str(deaths)}/{str(assists)}"
-        cs = int(details["minions_killed"])
-        gold_earned = int(details["gold_earned"])
-        damage_to_champions = int(details["damage_to_champions"])
-        if deaths == 0:
-            kda_value = kills + assists
-        else:
-            kda_value = round((kills + deaths) / deaths, 2)
-        if gold_earned == 0:
-            damage_per_gold = damage_to_champions
-        else:
-            damage_per_gold = round(damage_to_champions / gold_earned, 2)
 
-        result += f"""Game {str(index)}, {win_lose}
+def render_game_page(detailed_rows: List[dict], page: int) -> str:
+    """Render one page of games, page starts from 0"""
+    first = page * gv.GAMES_PER_PAGE
+    last = min(first + gv.GAMES_PER_PAGE, len(detailed_rows))
+    parts = [f"=== Games {first + 1}-{last} of {len(detailed_rows)} ===\n"]
+    for index in range(first, last):
+        parts.append(get_game_str(detailed_rows[index], index + 1))
+    return "".join(parts)
+
+
+def get_game_str(details: dict, index: int) -> str:
+    """Get the string of one game in detailed mode"""
+    if details["win"]:
+        win_lose = "WIN ✅"
+    else:
+        win_lose = "Lose ❌"
+    end_time = details["game_end"][:-4]
+    kills = int(details["kills"])
+    deaths = int(details["deaths"])
+    assists = int(details["assists"])
+    kda = f"{str(kills)}/{str(deaths)}/{str(assists)}"
+    cs = int(details["minions_killed"])
+    gold_earned = int(details["gold_earned"])
+    damage_to_champions = int(details["damage_to_champions"])
+    if deaths == 0:
+        kda_value = kills + assists
+    else:
+        kda_value = round((kills + deaths) / deaths, 2)
+    if gold_earned == 0:
+        damage_per_gold = damage_to_champions
+    else:
+        damage_per_gold = round(damage_to_champions / gold_earned, 2)
+
+    return f"""Game {str(index)}, {win_lose}
 End time: {end_time}
-Champion: {champion}
-Posistion: {posistion}
+Champion: {details["champion"]}
+Posistion: {details["posistion"]}
 KDA: {kda}, {str(kda_value)}
 CS: {str(cs)}
 Gold earned: {str(gold_earned)}
@@ -347,7 +621,21 @@ Damage to champtions: {str(damage_to_champions)}
 Damage per gold: {str(damage_per_gold)}
 
 """
-        index += 1
+
+
+def get_summary_str(detailed_rows: List[dict]) -> str:
+    """Get the summary of posistions, champions and total for !check"""
+    # Header
+    result = ["\n\n=== Details ===\n"]
+
+    summary_dict = {"posistion_played": set(), "champion_played": set()}
+
+    for details in detailed_rows:
+        champion = details["champion"]
+        posistion = details["posistion"]
+        kills = int(details["kills"])
+        deaths = int(details["deaths"])
+        assists = int(details["assists"])
 
         ## Store data for summary
         # Posistion played
@@ -445,7 +733,7 @@ Damage per gold: {str(damage_per_gold)}
     # Posistion played, posistion win rate, posistion kda,
     # champion played, champion win rate, champion kda,
     # total kda
-    result += "***Posistion Data***\n"
+    result.append("***Posistion Data***\n")
 
     for pos in summary_dict["posistion_played"]:
         posistion_wins = int(summary_dict[pos + "_win"])
@@ -462,14 +750,14 @@ Damage per gold: {str(damage_per_gold)}
             posistion_kda_value = round(
                 (posistion_kill + posistion_assists) / posistion_death, 2
             )
-        result += f"""{pos}
+        result.append(f"""{pos}
 Number of games: {str(summary_dict[pos])}
 Win rate: {str(posistion_wins)}/{str(posistion_loses)}, {str(posistion_win_rate)}%
 KDA: {str(posistion_kill)}/{str(posistion_death)}/{str(posistion_assists)}, {str(posistion_kda_value)}
 
-"""
+""")
 
-    result += "\n***Champion Data***\n"
+    result.append("\n***Champion Data***\n")
 
     for champ in summary_dict["champion_played"]:
         champion_wins = int(summary_dict[champ + "_win"])
@@ -484,14 +772,14 @@ KDA: {str(posistion_kill)}/{str(posistion_death)}/{str(posistion_assists)}, {str
             champion_kda_value = round(
                 (champion_kill + champion_assists) / champion_death, 2
             )
-        result += f"""{champ}
+        result.append(f"""{champ}
 Number of games: {str(summary_dict[champ])}
 Win rate: {str(champion_wins)}/{str(champion_loses)}, {str(champion_win_rate)}%
 KDA: {str(champion_kill)}/{str(champion_death)}/{str(champion_assists)}, {str(champion_kda_value)}
 
-"""
+""")
 
-    result += "\n***Total Data***\n"
+    result.append("\n***Total Data***\n")
 
     total_kills = int(summary_dict["kills"])
     total_deaths = int(summary_dict["deaths"])
@@ -501,23 +789,28 @@ KDA: {str(champion_kill)}/{str(champion_death)}/{str(champion_assists)}, {str(ch
     else:
         total_kda_value = round((total_kills + total_assists) / total_deaths, 2)
 
-    result += f"""Number of games: {str(index-1)}
+    result.append(
+        f"""Number of games: {str(len(detailed_rows))}
 KDA: {str(total_kills)}/{str(total_deaths)}/{str(total_assists)}, {str(total_kda_value)}"""
+    )
 
-    return result
+    return "".join(result)
 
 
 def split_string(text: str, max_length: int) -> List[str]:
     """Divide string into substrings to avoid them exceed 2000 character (Discrod limit)"""
     output = []
     lines = text.split("\n")
-    current_line = ""
+    current_lines = []
+    current_length = 0
 
     for line in lines:
-        if len(current_line + line) > max_length:
-            output.append(current_line)
-            current_line = ""
-        current_line += line + "\n"
-
-    output.append(current_line)
+        if current_length + len(line) > max_length:
+            output.append("".join(current_lines))
+            current_lines = []
+            current_length = 0
+        current_lines.append(line + "\n")
+        current_length += len(line) + 1
+
+    output.append("".join(current_lines))
     return output
@@ -1,3 +1,4 @@
+import json
 from sys import platform
 from typing import List, Tuple
 import mysql.connector
@@ -29,11 +30,50 @@ def call_stored_procedure_with_return(procedure_name: str, params: tuple) -> lis
     )
     cursor = db.cursor()
     result = cursor.callproc(procedure_name, params)
+    # Some procedures with return also write, e.g. sp_enqueue_check_job
+    db.commit()
     cursor.close()
     db.close()
     return result
 
 
+def call_stored_procedure_with_result_set(procedure_name: str, params: tuple) -> list:
+    """Call a stored procedure returning rows by SELECT"""
+    db = mysql.connector.connect(
+        host=gv.database_host,
+        user=gv.sql_user,
+        password=gv.sql_password,
+        database=gv.database,
+    )
+    cursor = db.cursor()
+    cursor.callproc(procedure_name, params)
+    rows = []
+    for result in cursor.stored_results():
+        rows.extend(result.fetchall())
+    cursor.close()
+    db.close()
+    return rows
+
+
+def call_stored_procedures_in_transaction(calls: List[Tuple[str, tuple]]) -> None:
+    """Call stored procedures with no return on one connection, committed together"""
+    db = mysql.connector.connect(
+        host=gv.database_host,
+        user=gv.sql_user,
+        password=gv.sql_password,
+        database=gv.database,
+    )
+    cursor = db.cursor()
+    try:
+        for procedure_name, params in calls:
+            cursor.callproc(procedure_name, params)
+        db.commit()
+    finally:
+        # Closing without commit rolls back the calls made
+        cursor.close()
+        db.close()
+
+
 def add_summoner(summoner_name: str, summoner_id: str, puuid: str) -> None:
     """Add new summoner to summoners table"""
     params = (summoner_name, summoner_id, puuid)
@@ -66,18 +106,25 @@ def get_match_ids_not_in_db(id_list: list) -> List[str]:
     return not_exist
 
 
-def insert_to_matches(data_list) -> None:
-    """Insert given data to matches table"""
-    params = tuple(data_list)
-    call_stored_procedure_no_return("sp_add_new_match", params)
+def insert_match(data_list, api_result: dict) -> None:
+    """Insert a match to matches table and its players to match_players table
+
+    They are committed together, so other processes never find the match
+    before its players, e.g. a worker waiting for a match claimed by another.
+    """
+    calls = [("sp_add_new_match", tuple(data_list))]
+    for params in get_match_players_params(api_result):
+        calls.append(("sp_add_new_match_players_record", params))
+    call_stored_procedures_in_transaction(calls)
 
 
-def insert_to_match_players(api_result: dict) -> None:
-    """Insert data to match_players table from API result"""
+def get_match_players_params(api_result: dict) -> List[tuple]:
+    """Params of sp_add_new_match_players_record for each player in API result"""
 
     # Get reuquired values from the api result
     # Common column
     match_id = api_result["metadata"]["matchId"]
+    params_list = []
 
     for player_data in api_result["info"]["participants"]:
         param_list = []
@@ -92,10 +139,9 @@ def insert_to_match_players(api_result: dict) -> None:
         param_list.append(player_data["totalDamageDealtToChampions"])
         param_list.append(player_data["totalMinionsKilled"])
         param_list.append(player_data["win"])
+        params_list.append(tuple(param_list))
 
-        # Insert to match_players table
-        params = tuple(param_list)
-        call_stored_procedure_no_return("sp_add_new_match_players_record", params)
+    return params_list
 
 
 def count_win_lose(match_id_list: List[str], puuid: str) -> Tuple[int, int]:
@@ -131,3 +177,118 @@ def get_details(match_id: str, puuid: str) -> dict:
         game_end=result[10],
         win=result[11],
     )
+
+
+def set_guild_default(
+    guild_id: int, summoner_name: str, period: str, region_v4: str, region_v5: str
+) -> None:
+    """Set the default summoner name, period and regions of a guild"""
+    params = (guild_id, summoner_name, period, region_v4, region_v5)
+    call_stored_procedure_no_return("sp_set_guild_default", params)
+
+
+def get_guild_default(guild_id: int) -> Tuple[str, str, str, str]:
+    """Get the default summoner name, period and regions of a guild, empty string if not set"""
+    params = (guild_id, "", "", "", "")
+    result = call_stored_procedure_with_return("sp_get_guild_default", params)
+    # Return body: (guild_id, summoner_name, period, region_v4, region_v5)
+    return result[1] or "", result[2] or "", result[3] or "", result[4] or ""
+
+
+def enqueue_check_job(
+    guild_id: int,
+    user_id: int,
+    summoner_name: str,
+    period: str,
+    mode: str,
+    region_v4: str,
+    region_v5: str,
+) -> int:
+    """Queue a check for worker.py, return the job id, shared with an identical waiting job"""
+    params = (guild_id, user_id, summoner_name, period, mode, region_v4, region_v5, 0)
+    result = call_stored_procedure_with_return("sp_enqueue_check_job", params)
+    return result[7]
+
+
+def claim_check_job(worker: str, lease_seconds: int, max_attempts: int) -> dict:
+    """Take the next queued check job with a lease, None if no job"""
+    params = (worker, lease_seconds, max_attempts, 0, "", "", "", "", "")
+    result = call_stored_procedure_with_return("sp_claim_check_job", params)
+    if result[3] is None:
+        return None
+    return dict(
+        job_id=result[3],
+        summoner_name=result[4],
+        period=result[5],
+        mode=result[6],
+        region_v4=result[7],
+        region_v5=result[8],
+    )
+
+
+def renew_check_job_lease(job_id: int, worker: str, lease_seconds: int) -> None:
+    """Extend the lease of a running check job"""
+    params = (job_id, worker, lease_seconds)
+    call_stored_procedure_no_return("sp_renew_check_job_lease", params)
+
+
+def complete_check_job(job_id: int, worker: str, result: str) -> None:
+    """Save the result of a check job"""
+    params = (job_id, worker, result)
+    call_stored_procedure_no_return("sp_complete_check_job", params)
+
+
+def fail_check_job(
+    job_id: int, worker: str, max_attempts: int, retry_seconds: int, error: str
+) -> None:
+    """Put a check job back to queue for retry after retry_seconds, or mark it failed after max_attempts"""
+    params = (job_id, worker, max_attempts, retry_seconds, error)
+    call_stored_procedure_no_return("sp_fail_check_job", params)
+
+
+def get_finished_check_jobs(job_ids: List[int]) -> List[Tuple[int, str, str]]:
+    """Get (job_id, status, result) of the check jobs that are done or failed"""
+    params = (json.dumps(job_ids),)
+    return call_stored_procedure_with_result_set("sp_get_finished_check_jobs", params)
+
+
+def claim_match(match_id: str, worker: str, lease_seconds: int) -> bool:
+    """Claim a match to get from Riot API, False if another worker is getting it"""
+    params = (match_id, worker, lease_seconds, 0)
+    result = call_stored_procedure_with_return("sp_claim_match", params)
+    return bool(result[3])
+
+
+def acquire_rate_slot(limits: List[Tuple[int, int]]) -> float:
+    """Count one API call in the shared ledger, return 0 if counted, else seconds to wait"""
+    params = (json.dumps(limits), 0.0)
+    result = call_stored_procedure_with_return("sp_acquire_rate_slot", params)
+    return result[1]
+
+
+def add_month_partitions(table: str, months_ahead: int) -> None:
+    """Create monthly partitions of table up to months_ahead from now"""
+    params = (table, months_ahead)
+    call_stored_procedure_no_return("sp_add_month_partitions", params)
+
+
+def archive_before(before: str) -> None:
+    """Move all matches that ended before the date (YYYY-MM-DD) to archive tables"""
+    params = (before,)
+    call_stored_procedure_no_return("sp_archive_before", params)
+
+
+def archive_untracked_match_players(before: str) -> int:
+    """Move rows of players not in summoners ended before the datetime to archive"""
+    params = (before, 0)
+    result = call_stored_procedure_with_return(
+        "sp_archive_untracked_match_players", params
+    )
+    return result[1]
+
+
+def get_summoner_match_rows(puuid: str) -> list:
+    """Get every game of a summoner except remakes, ordered by game end"""
+    # Row: (match_id, game_end_datetime, win, kills, deaths, assists,
+    # gold_earned, damage_to_champions, minions_killed, champion_name, individual_posistion)
+    return call_stored_procedure_with_result_set("sp_summoner_match_rows", (puuid,))
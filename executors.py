@@ -0,0 +1,114 @@
+import asyncio
+import functools
+import time
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Tuple
+import global_variables as gv
+
+
+class ExecutorBusy(Exception):
+    """Raised when an executor already has its maximum number of queued jobs"""
+
+
+def _timed_call(func: Callable, *args, **kwargs) -> Tuple[float, Any]:
+    """Run func and return the time it started running with its result"""
+    # Module level so that it can be pickled for process pools
+    started_at = time.time()
+    return started_at, func(*args, **kwargs)
+
+
+class BoundedExecutor:
+    """Executor with a fixed number of workers and a limited queue"""
+
+    def __init__(self, name: str, executor: Executor, workers: int, max_queue: int):
+        self.name = name
+        self.executor = executor
+        self.workers = workers
+        self.max_queue = max_queue
+        # Jobs submitted and not yet finished, only touched on the event loop
+        self.pending = 0
+        self.rejected = 0
+        # Recent waiting time in queue in seconds
+        self.waits = deque(maxlen=100)
+
+    @property
+    def queued(self) -> int:
+        """Number of jobs waiting for a free worker"""
+        return max(0, self.pending - self.workers)
+
+    async def run(self, blocking_func: Callable, *args, **kwargs) -> Any:
+        """Run a blocking function in the executor, raise ExecutorBusy if full"""
+        if self.pending >= self.workers + self.max_queue:
+            self.rejected += 1
+            raise ExecutorBusy(f"{self.name} executor is busy")
+
+        func = functools.partial(_timed_call, blocking_func, *args, **kwargs)
+        submitted_at = time.time()
+        self.pending += 1
+        try:
+            started_at, result = await asyncio.get_running_loop().run_in_executor(
+                self.executor, func
+            )
+        finally:
+            self.pending -= 1
+        self.waits.append(max(0.0, started_at - submitted_at))
+        return result
+
+    def stats(self) -> dict:
+        """Queue depth and waiting time of this executor"""
+        if len(self.waits) > 0:
+            average_wait = sum(self.waits) / len(self.waits)
+            max_wait = max(self.waits)
+        else:
+            average_wait = 0.0
+            max_wait = 0.0
+        return dict(
+            name=self.name,
+            workers=self.workers,
+            running=self.pending - self.queued,
+            queued=self.queued,
+            max_queue=self.max_queue,
+            rejected=self.rejected,
+            average_wait=round(average_wait, 3),
+            max_wait=round(max_wait, 3),
+        )
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+# Network and database bound work, e.g. core.blocking_check
+io_executor = BoundedExecutor(
+    "io",
+    ThreadPoolExecutor(max_workers=gv.IO_WORKERS, thread_name_prefix="gumawilson-io"),
+    gv.IO_WORKERS,
+    gv.IO_MAX_QUEUE,
+)
+
+# Short database calls that a command waits for before replying
+db_executor = BoundedExecutor(
+    "db",
+    ThreadPoolExecutor(max_workers=gv.DB_WORKERS, thread_name_prefix="gumawilson-db"),
+    gv.DB_WORKERS,
+    gv.DB_MAX_QUEUE,
+)
+
+# Pure computation on data already fetched, e.g. rendering and aggregation
+cpu_executor = BoundedExecutor(
+    "cpu",
+    ProcessPoolExecutor(max_workers=gv.CPU_WORKERS),
+    gv.CPU_WORKERS,
+    gv.CPU_MAX_QUEUE,
+)
+
+
+def all_stats() -> list:
+    """Stats of every executor"""
+    return [io_executor.stats(), db_executor.stats(), cpu_executor.stats()]
+
+
+def shutdown() -> None:
+    io_executor.shutdown()
+    db_executor.shutdown()
+    cpu_executor.shutdown()
@@ -1,4 +1,5 @@
 import os
+import socket
 from sys import platform
 from tzlocal import get_localzone
 
@@ -40,13 +41,11 @@ REGION_V5_LIST = ["americas", "asia", "europe", "sea"]
 
 ## Global variables
 
-# Summoner name
-default_summoner_name = ""
-# For SUMMONER-V4 API
+# For SUMMONER-V4 API, used by guilds without their own default and backfill.py
 region_v4 = "tw2"
-# For MATCH-V5 API
+# For MATCH-V5 API, used by guilds without their own default and backfill.py
 region_v5 = "sea"
-# In DEFAULT_PERIOD_LIST
+# In DEFAULT_PERIOD_LIST, used by guilds without their own default
 default_period = "today"
 # Timezone
 local_timezone = str(get_localzone())
@@ -61,3 +60,125 @@ if platform == "linux":
 elif platform == "win32":
     sql_user = os.getenv("GUMAWILSON_SQL_AC")
     sql_password = os.getenv("GUMAWILSON_SQL_PW")
+
+
+# Executors
+# Threads for Riot API and database calls
+IO_WORKERS = 4
+# Checks allowed to wait for a free IO worker before replying busy
+IO_MAX_QUEUE = 8
+# Threads for short database calls of commands, e.g. guild defaults and check
+# jobs of the gateway, kept apart so that they never wait behind checks
+DB_WORKERS = 4
+# Enough for every check of the gateway to be queued at once
+DB_MAX_QUEUE = 300
+# Processes for rendering and aggregation
+CPU_WORKERS = 2
+CPU_MAX_QUEUE = 8
+
+# Detailed check
+# Games rendered on each page of the detailed view
+GAMES_PER_PAGE = 5
+# Seconds before the page buttons stop responding
+PAGINATOR_TIMEOUT = 600
+
+# Riot API
+# (calls, seconds) pairs of the API key, default is a development key
+RIOT_RATE_LIMITS = [(20, 1), (100, 120)]
+# Seconds before a call is abandoned
+API_TIMEOUT = 10
+# Retries for 429 and 5xx, waiting API_BACKOFF_BASE * 2^n seconds up to API_BACKOFF_CAP
+API_MAX_RETRIES = 5
+API_BACKOFF_BASE = 1
+API_BACKOFF_CAP = 30
+# Consecutive failures of a host before failing fast for API_CIRCUIT_COOLDOWN seconds
+API_CIRCUIT_THRESHOLD = 5
+API_CIRCUIT_COOLDOWN = 30
+# Seconds to remember a 404, e.g. a mistyped summoner name
+API_NOT_FOUND_TTL = 300
+
+# Backfill
+# Share of RIOT_RATE_LIMITS used by backfill.py. With --distributed the shared
+# ledger stops backfill.py at this share and the bot may use the rest.
+BACKFILL_BUDGET_SHARE = 0.5
+# Share of RIOT_RATE_LIMITS used by a standalone bot, lower it while backfill.py
+# runs without --distributed, e.g. to 1 - BACKFILL_BUDGET_SHARE
+BOT_BUDGET_SHARE = float(os.getenv("GUMAWILSON_BOT_BUDGET_SHARE", "1.0"))
+BACKFILL_CHECKPOINT = "backfill_checkpoint.json"
+
+# Caches and snapshot
+# Seconds to trust a cached name -> puuid mapping
+SUMMONER_CACHE_TTL = 86400
+SUMMONER_CACHE_SIZE = 1000
+# Finished periods to keep match ids and results of
+PERIOD_CACHE_SIZE = 500
+# A period is finished if it ended more than this many seconds ago
+FINISHED_PERIOD_MARGIN = 3600
+SNAPSHOT_PATH = "snapshot.json"
+# Seconds between snapshots, a snapshot is also saved on shutdown
+SNAPSHOT_INTERVAL = 300
+# Snapshots older than this many seconds are ignored
+SNAPSHOT_MAX_AGE = 86400
+
+# Event loop monitor
+# Seconds between loop lag samples
+LOOP_LAG_INTERVAL = 0.25
+# Samples kept for percentiles, 10 minutes
+LOOP_LAG_SAMPLES = 2400
+# Seconds the loop is blocked before its stack is recorded
+LOOP_BLOCK_THRESHOLD = 0.5
+# p99 loop lag in milliseconds that fails a benchmark run, unset to disable
+MAX_LOOP_LAG_MS = os.getenv("GUMAWILSON_MAX_LOOP_LAG_MS")
+if MAX_LOOP_LAG_MS is not None:
+    MAX_LOOP_LAG_MS = float(MAX_LOOP_LAG_MS)
+
+# Fair scheduling of checks
+# Checks running at the same time for one guild
+GUILD_MAX_RUNNING = 2
+# Checks waiting in the queue of one guild
+GUILD_MAX_QUEUED = 10
+# Checks queued or running for one user
+USER_MAX_CHECKS = 2
+# (calls, seconds) of Riot API one guild may use before others get its turn,
+# not applied in gateway mode where the calls are made by worker.py
+GUILD_API_BUDGET = (50, 120)
+
+# Scale out
+# "standalone" runs checks in the bot process,
+# "gateway" queues them in database for worker.py processes
+BOT_MODE = os.getenv("GUMAWILSON_MODE", "standalone")
+# Share the rate limit and match ingestion with other processes through database
+distributed = BOT_MODE == "gateway"
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+# Seconds a worker holds a check job or a match before others may take it over
+JOB_LEASE_SECONDS = 60
+MATCH_CLAIM_SECONDS = 30
+# Tries of a check job before it is marked failed
+JOB_MAX_ATTEMPTS = 3
+# Seconds before a failed check job is tried again, e.g. after an open circuit
+JOB_RETRY_DELAY = 30
+# Seconds between polls of the job table
+JOB_POLL_INTERVAL = 1
+# Seconds the gateway waits for a check job
+JOB_TIMEOUT = 900
+# Checks the gateway keeps in check_jobs at the same time, they only wait on the
+# event loop, so add workers rather than raise IO_WORKERS for more throughput
+GATEWAY_MAX_JOBS = 200
+# Checks waiting in the gateway while GATEWAY_MAX_JOBS are in check_jobs
+GATEWAY_MAX_QUEUE = 100
+
+# Tiering, run by tiering.py
+# Months of partitions created ahead of now
+PARTITION_MONTHS_AHEAD = 3
+# Months of all matches kept in the partitioned tables
+HOT_MONTHS = 12
+# Days before rows of players not in summoners are archived
+UNTRACKED_HOT_DAYS = 30
+
+# Analytics
+# Summoners kept as NumPy columns in memory
+ANALYTICS_CACHE_SIZE = 100
+# Points shown for a rolling trend
+TREND_POINTS = 15
+# Seconds before cached columns are reloaded, for matches ingested by other processes
+ANALYTICS_CACHE_TTL = 600
@@ -0,0 +1,163 @@
+import asyncio
+import json
+import threading
+import time
+from typing import List, Tuple
+import core
+import database_operations as dbo
+import executors
+import global_variables as gv
+
+
+class JobWaiter:
+    """Wait for check jobs on the event loop, polling all of them in one database call"""
+
+    def __init__(self):
+        # job id -> futures of (status, result), identical checks share a job
+        self.futures = {}
+        self.task = None
+
+    async def wait(self, job_id: int) -> Tuple[str, str]:
+        """Wait until a job is done or failed, return its status and result"""
+        future = asyncio.get_running_loop().create_future()
+        self.futures.setdefault(job_id, []).append(future)
+        if self.task is None or self.task.done():
+            self.task = asyncio.ensure_future(self.poll())
+        try:
+            return await future
+        finally:
+            # Stop polling a job nobody waits for, e.g. after timeout
+            waiting = self.futures.get(job_id, [])
+            if future in waiting:
+                waiting.remove(future)
+                if len(waiting) == 0:
+                    del self.futures[job_id]
+
+    async def poll(self) -> None:
+        while len(self.futures) > 0:
+            await asyncio.sleep(gv.JOB_POLL_INTERVAL)
+            if len(self.futures) == 0:
+                break
+            try:
+                rows = await executors.db_executor.run(
+                    dbo.get_finished_check_jobs, list(self.futures)
+                )
+            except Exception as e:
+                # e.g. database unavailable, try again on next poll
+                core.log(f"Failed to poll check jobs, {str(e)}")
+                continue
+            for job_id, status, result in rows:
+                for future in self.futures.pop(job_id, []):
+                    if not future.done():
+                        future.set_result((status, result))
+
+
+job_waiter = JobWaiter()
+
+
+async def remote_check(
+    guild_id: int,
+    user_id: int,
+    region_v4: str,
+    region_v5: str,
+    summoner_name: str,
+    period: str,
+    mode: str,
+) -> Tuple[bool, str, List[dict]]:
+    """Queue a check for worker.py and wait for it on the event loop, same return as core.blocking_check"""
+    try:
+        job_id = await executors.db_executor.run(
+            dbo.enqueue_check_job,
+            guild_id,
+            user_id,
+            summoner_name,
+            period,
+            mode,
+            region_v4,
+            region_v5,
+        )
+    except executors.ExecutorBusy:
+        raise
+    except Exception as e:
+        return False, f"Failed to queue the check, {str(e)}", []
+
+    try:
+        status, result = await asyncio.wait_for(job_waiter.wait(job_id), gv.JOB_TIMEOUT)
+    except asyncio.TimeoutError:
+        return False, "Check timed out, please try again later", []
+    if status == "done":
+        result = json.loads(result)
+        return result["status"], result["message"], result["detailed_rows"]
+    return False, f"Check failed: {result}", []
+
+
+class LeaseKeeper:
+    """Renew the lease of a running job until stopped"""
+
+    def __init__(self, job_id: int, worker: str):
+        self.job_id = job_id
+        self.worker = worker
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.renew, daemon=True)
+
+    def renew(self) -> None:
+        while not self.stopped.wait(gv.JOB_LEASE_SECONDS / 3):
+            try:
+                dbo.renew_check_job_lease(
+                    self.job_id, self.worker, gv.JOB_LEASE_SECONDS
+                )
+            except Exception as e:
+                core.log(
+                    f"{self.worker} failed to renew lease of job {self.job_id}, {e}"
+                )
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.stopped.set()
+        self.thread.join()
+
+
+def run_one_job(worker: str) -> bool:
+    """Claim and run one check job, return False if there is no job"""
+    job = dbo.claim_check_job(worker, gv.JOB_LEASE_SECONDS, gv.JOB_MAX_ATTEMPTS)
+    if job is None:
+        return False
+
+    job_id = job["job_id"]
+    core.log(f"{worker} running job {job_id}, {job['summoner_name']} {job['period']}")
+    try:
+        with LeaseKeeper(job_id, worker):
+            status, message, detailed_rows = core.run_in_regions(
+                job["region_v4"],
+                job["region_v5"],
+                core.blocking_check,
+                job["summoner_name"],
+                job["period"],
+                job["mode"],
+                # Rate limit, 5xx and open circuit are retried below
+                raise_transient=True,
+            )
+        result = dict(status=status, message=message, detailed_rows=detailed_rows)
+        # Datetime from database are saved as string, as they are displayed
+        dbo.complete_check_job(job_id, worker, json.dumps(result, default=str))
+    except Exception as e:
+        core.log(f"{worker} failed job {job_id}, {str(e)}")
+        dbo.fail_check_job(
+            job_id, worker, gv.JOB_MAX_ATTEMPTS, gv.JOB_RETRY_DELAY, str(e)
+        )
+    return True
+
+
+def worker_loop(worker: str) -> None:
+    """Run check jobs forever"""
+    while True:
+        try:
+            if not run_one_job(worker):
+                time.sleep(gv.JOB_POLL_INTERVAL)
+        except Exception as e:
+            # e.g. database unavailable, try again later
+            core.log(f"{worker} error, {str(e)}")
+            time.sleep(gv.JOB_POLL_INTERVAL)
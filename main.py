@@ -1,9 +1,19 @@
 import functools
-from typing import Any, Callable, List, Tuple
+from typing import List, Tuple
 import discord
 from discord import option
+from discord.ext import tasks
+import analytics
+import call_api
 import core
+import database_operations as dbo
+import executors
 import global_variables as gv
+import jobs
+import monitor
+import scheduler
+import snapshot
+import views
 
 
 # Discord bot setup
@@ -15,12 +25,52 @@ bot = discord.Bot(
 )
 
 
-async def run_blocking(blocking_func: Callable, *args, **kwargs) -> Any:
-    """Runs a blocking function in a non-blocking way"""
-    func = functools.partial(
-        blocking_func, *args, **kwargs
-    )  # `run_in_executor` doesn't support kwargs, `functools.partial` does
-    return await bot.loop.run_in_executor(None, func)
+@bot.event
+async def on_ready():
+    monitor.loop_monitor.start()
+    # Load snapshot after connected, checks before it is loaded just start cold
+    if not snapshot.loaded:
+        try:
+            await executors.io_executor.run(snapshot.load)
+        except executors.ExecutorBusy:
+            pass
+    if not save_snapshot.is_running():
+        save_snapshot.start()
+
+
+@tasks.loop(seconds=gv.SNAPSHOT_INTERVAL)
+async def save_snapshot():
+    """Save the hot working set periodically"""
+    try:
+        await executors.io_executor.run(snapshot.save)
+    except executors.ExecutorBusy:
+        pass
+
+
+# guild key -> (default summoner name, default period, region_v4, region_v5),
+# read from database once
+guild_defaults = {}
+
+
+def guild_key(ctx) -> int:
+    """Key of the server for defaults and scheduling, per user in direct messages"""
+    # Discord ids are positive, so negative user ids never clash with guild ids
+    return ctx.guild_id or -ctx.author.id
+
+
+async def get_guild_default(guild_id: int) -> Tuple[str, str, str, str]:
+    """Default summoner name, period and regions of a guild, regions of gv if not set"""
+    if guild_id not in guild_defaults:
+        summoner_name, period, region_v4, region_v5 = await executors.db_executor.run(
+            dbo.get_guild_default, guild_id
+        )
+        guild_defaults[guild_id] = (
+            summoner_name,
+            period,
+            region_v4 or gv.region_v4,
+            region_v5 or gv.region_v5,
+        )
+    return guild_defaults[guild_id]
 
 
 # Discord bot commands
@@ -62,47 +112,150 @@ async def check(
     days: int,
 ) -> None:
     """Check a player, call !check only will check the default one"""
-    interaction = ctx.interaction
-    # Use default if None is given
+    # Acknowledge first, Discord fails the interaction without a reply in 3 seconds
+    await ctx.defer()
+    guild_id = guild_key(ctx)
+    try:
+        (
+            default_summoner_name,
+            default_period,
+            region_v4,
+            region_v5,
+        ) = await get_guild_default(guild_id)
+    except executors.ExecutorBusy:
+        await ctx.respond("Gumawilson is busy, please try again later")
+        return
+    # Use default of the guild if None is given
     if summoner_name is None:
-        summoner_name = gv.default_summoner_name
+        summoner_name = default_summoner_name
     if period is None:
-        period = gv.default_period
+        period = default_period or gv.default_period
 
     if summoner_name == "":
-        await interaction.response.send_message(
-            "Please specify a summoner name or set a default one"
-        )
+        await ctx.respond("Please specify a summoner name or set a default one")
         return
     if period == "":
-        await interaction.response.send_message(
+        await ctx.respond(
             f"Please specify a period or set a default one from [{', '.join(gv.DEFAULT_PERIOD_LIST)}]"
         )
         return
-    if gv.region_v4 == "":
-        await interaction.response.send_message(
-            f"Please set region_v4 from [{', '.join(gv.REGION_V4_LIST)}]"
-        )
+    if region_v4 == "":
+        await ctx.respond(f"Please set region_v4 from [{', '.join(gv.REGION_V4_LIST)}]")
         return
-    if gv.region_v5 == "":
-        await interaction.response.send_message(
-            f"Please set region_v5 from [{', '.join(gv.REGION_V5_LIST)}]"
-        )
+    if region_v5 == "":
+        await ctx.respond(f"Please set region_v5 from [{', '.join(gv.REGION_V5_LIST)}]")
         return
 
     # Overwrite period if there is input in days (old last_n_days parameter)
     if days is not None:
         period = f"last_{str(days)}_days"
 
-    await interaction.response.send_message(
-        f"Check {summoner_name} started, called by {ctx.author.name}"
-    )
-    result: Tuple[bool, str] = await run_blocking(
-        core.blocking_check, summoner_name, period, mode
-    )
+    await ctx.respond(f"Check {summoner_name} started, called by {ctx.author.name}")
+    try:
+        if gv.BOT_MODE == "gateway":
+            # Run by worker.py, waited for on the loop without a thread
+            check_scheduler = scheduler.remote_check_scheduler
+            check_func = functools.partial(
+                jobs.remote_check, guild_id, ctx.author.id, region_v4, region_v5
+            )
+        else:
+            check_scheduler = scheduler.check_scheduler
+            check_func = functools.partial(
+                core.run_in_regions, region_v4, region_v5, core.blocking_check
+            )
+        result: Tuple[bool, str, List[dict]] = await check_scheduler.submit(
+            guild_id, ctx.author.id, check_func, summoner_name, period, mode
+        )
+        summary_pages: List[str] = await executors.cpu_executor.run(
+            core.render_summary_pages, result[1], result[2]
+        )
+    except scheduler.QuotaExceeded as e:
+        await ctx.send(str(e))
+        return
+    except executors.ExecutorBusy:
+        await ctx.send("Gumawilson is busy, please try again later")
+        return
 
-    for text in core.split_string(result[1], 1950):
-        await ctx.send(f"```{text}```")
+    await views.send_check_result(ctx, summary_pages, result[2])
+
+
+@bot.slash_command(name="trend")
+@option(
+    "metric",
+    str,
+    description="Metric to show",
+    choices=analytics.TREND_METRICS,
+)
+@option(
+    "summoner_name",
+    str,
+    description="Name of the summoner",
+    required=False,
+)
+@option(
+    "window",
+    int,
+    description="Number of games in each point of a rolling metric",
+    required=False,
+    default=20,
+    min_value=1,
+    max_value=500,
+)
+@option(
+    "champion",
+    str,
+    description="Only count games with this champion, e.g. MissFortune",
+    required=False,
+)
+async def trend(
+    ctx,
+    metric: str,
+    summoner_name: str,
+    window: int,
+    champion: str,
+) -> None:
+    """Show the trend of a player over all recorded games"""
+    await ctx.defer()
+    guild_id = guild_key(ctx)
+    try:
+        default_summoner_name, _, region_v4, region_v5 = await get_guild_default(
+            guild_id
+        )
+    except executors.ExecutorBusy:
+        await ctx.respond("Gumawilson is busy, please try again later")
+        return
+    if summoner_name is None:
+        summoner_name = default_summoner_name
+    if summoner_name == "":
+        await ctx.respond("Please specify a summoner name or set a default one")
+        return
+    if region_v4 == "":
+        await ctx.respond(f"Please set region_v4 from [{', '.join(gv.REGION_V4_LIST)}]")
+        return
+
+    await ctx.respond(f"Trend of {summoner_name} started, called by {ctx.author.name}")
+    try:
+        message: str = await scheduler.check_scheduler.submit(
+            guild_id,
+            ctx.author.id,
+            core.run_in_regions,
+            region_v4,
+            region_v5,
+            core.blocking_trend,
+            summoner_name,
+            metric,
+            window,
+            champion,
+        )
+    except scheduler.QuotaExceeded as e:
+        await ctx.send(str(e))
+        return
+    except executors.ExecutorBusy:
+        await ctx.send("Gumawilson is busy, please try again later")
+        return
+
+    for part in core.split_string(message, 1950):
+        await ctx.send(f"```{part}```")
 
 
 @bot.slash_command(name="set_default")
@@ -122,14 +275,20 @@ async def set_default(
     region5: str,
     period: str,
 ) -> None:
-    """Set the default values"""
-    gv.default_summoner_name = summoner_name
-    gv.region_v4 = region4
-    gv.region_v5 = region5
-    gv.default_period = period
+    """Set the default values of this server"""
+    await ctx.defer()
+    guild_id = guild_key(ctx)
+    try:
+        await executors.db_executor.run(
+            dbo.set_guild_default, guild_id, summoner_name, period, region4, region5
+        )
+    except executors.ExecutorBusy:
+        await ctx.respond("Gumawilson is busy, please try again later")
+        return
+    guild_defaults[guild_id] = (summoner_name, period, region4, region5)
     await ctx.respond(
         f"Default checking parameters updated: \
-{gv.default_summoner_name} in {gv.region_v4}, {gv.region_v5} for {gv.default_period}."
+{summoner_name} in {region4}, {region5} for {period}."
     )
 
 
@@ -148,5 +307,53 @@ async def show_period(interaction: discord.Interaction):
     )
 
 
+@bot.slash_command(name="status")
+async def status(interaction: discord.Interaction):
+    """Show queue depth and waiting time of the executors"""
+    lines = []
+    for stats in executors.all_stats():
+        lines.append(
+            f"{stats['name']}: {stats['running']}/{stats['workers']} running, \
+{stats['queued']}/{stats['max_queue']} queued, {stats['rejected']} rejected, \
+wait avg {stats['average_wait']}s max {stats['max_wait']}s"
+        )
+    for stats in scheduler.all_stats():
+        lines.append(
+            f"{stats['name']}: {stats['running']} running, {stats['queued']} queued \
+from {stats['guilds_waiting']} servers, {stats['rejected']} rejected"
+        )
+    await interaction.response.send_message(
+        "```" + "\n".join(lines) + "```", ephemeral=True
+    )
+
+
+@bot.slash_command(name="loop_stats")
+@discord.default_permissions(administrator=True)
+async def loop_stats(interaction: discord.Interaction):
+    """Show event loop lag and the call sites that blocked it"""
+    stats = monitor.loop_monitor.percentiles()
+    lines = [
+        f"Loop lag over {stats['samples']} samples: p50 {stats['p50']}ms, \
+p90 {stats['p90']}ms, p99 {stats['p99']}ms, max {stats['max']}ms"
+    ]
+    for call_site, count in monitor.loop_monitor.slow_call_sites.most_common(5):
+        lines.append(f"{count} stalls at {call_site}")
+    latest_stall = monitor.loop_monitor.latest_stall()
+    if latest_stall != "":
+        lines.append(latest_stall)
+    await interaction.response.send_message(
+        "```" + "\n".join(lines) + "```", ephemeral=True
+    )
+
+
 # Start the bot
-bot.run(gv.DISCORD_TOKEN)
+if __name__ == "__main__":
+    if not gv.distributed:
+        # The rate limit is per API key, leave a share free for backfill.py if set
+        call_api.set_budget_share(gv.BOT_BUDGET_SHARE)
+    bot.run(gv.DISCORD_TOKEN)
+    if snapshot.loaded:
+        snapshot.save()
+    executors.shutdown()
+    # Fail benchmark runs with GUMAWILSON_MAX_LOOP_LAG_MS set
+    monitor.loop_monitor.check_threshold()
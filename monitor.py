@@ -0,0 +1,150 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, deque
+from datetime import datetime
+from typing import List
+import core
+import global_variables as gv
+
+# Call sites in files of this directory are reported before library code
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class LoopLagExceeded(Exception):
+    """Loop lag is over gv.MAX_LOOP_LAG_MS"""
+
+
+def is_project_file(filename: str) -> bool:
+    """Whether filename is code of this project, not a library installed under it"""
+    if not filename.startswith(PROJECT_DIR + os.sep):
+        return False
+    parts = os.path.relpath(filename, PROJECT_DIR).split(os.sep)
+    return not any(
+        part in ["site-packages", "dist-packages", "venv", ".venv"] for part in parts
+    )
+
+
+def find_call_site(stack: List[traceback.FrameSummary]) -> str:
+    """The innermost frame in project code, or the innermost frame if none"""
+    for frame in reversed(stack):
+        if (
+            is_project_file(frame.filename)
+            and os.path.basename(frame.filename) != "monitor.py"
+        ):
+            return f"{os.path.basename(frame.filename)}:{frame.lineno} {frame.name}"
+    frame = stack[-1]
+    return f"{frame.filename}:{frame.lineno} {frame.name}"
+
+
+def format_project_stack(stack: List[traceback.FrameSummary]) -> str:
+    """Formatted frames of project code in stack, all frames if none"""
+    frames = [frame for frame in stack if is_project_file(frame.filename)]
+    return "".join(traceback.format_list(frames or stack))
+
+
+class LoopMonitor:
+    """Measure event loop scheduling lag, and catch the stack of calls blocking it"""
+
+    def __init__(self):
+        self.lags = deque(maxlen=gv.LOOP_LAG_SAMPLES)
+        self.heartbeat = time.monotonic()
+        self.loop_thread_id = None
+        self.task = None
+        # call site -> number of stalls caught there
+        self.slow_call_sites = Counter()
+        # (time, seconds blocked, formatted project frames) of recent stalls
+        self.recent_stalls = deque(maxlen=10)
+
+    def start(self) -> None:
+        """Start monitoring the running loop, call from inside the loop"""
+        if self.task is not None:
+            return
+        self.loop_thread_id = threading.get_ident()
+        self.heartbeat = time.monotonic()
+        self.task = asyncio.get_running_loop().create_task(self.measure())
+        threading.Thread(
+            target=self.watchdog, name="gumawilson-loop-watchdog", daemon=True
+        ).start()
+
+    async def measure(self) -> None:
+        """Sleep for a fixed interval, anything longer is time the loop was busy"""
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + gv.LOOP_LAG_INTERVAL
+            await asyncio.sleep(gv.LOOP_LAG_INTERVAL)
+            self.lags.append(max(0.0, loop.time() - expected))
+            self.heartbeat = time.monotonic()
+
+    def watchdog(self) -> None:
+        """Runs in another thread, grab the loop's stack when it stops beating"""
+        reported_heartbeat = None
+        while True:
+            time.sleep(gv.LOOP_LAG_INTERVAL)
+            heartbeat = self.heartbeat
+            blocked = time.monotonic() - heartbeat - gv.LOOP_LAG_INTERVAL
+            if blocked < gv.LOOP_BLOCK_THRESHOLD or heartbeat == reported_heartbeat:
+                continue
+            # Report each stall once
+            reported_heartbeat = heartbeat
+            frame = sys._current_frames().get(self.loop_thread_id)
+            if frame is None:
+                continue
+            stack = traceback.extract_stack(frame)
+            call_site = find_call_site(stack)
+            self.slow_call_sites[call_site] += 1
+            stack_str = format_project_stack(stack)
+            self.recent_stalls.append((time.time(), blocked, stack_str))
+            core.log(
+                f"Event loop blocked for {blocked:.2f}s at {call_site}\n{stack_str.rstrip()}"
+            )
+
+    def latest_stall(self, max_length: int = 1200) -> str:
+        """Time, duration and stack of the latest stall, innermost frames kept within max_length"""
+        if len(self.recent_stalls) == 0:
+            return ""
+        stalled_at, blocked, stack_str = self.recent_stalls[-1]
+        if len(stack_str) > max_length:
+            # Cut at the start of a frame
+            stack_str = stack_str[-max_length:]
+            stack_str = "...\n" + stack_str[max(stack_str.find('  File "'), 0) :]
+        stalled_at_str = datetime.fromtimestamp(stalled_at).strftime(
+            "%Y-%m-%d %H:%M:%S"
+        )
+        return f"Latest stall at {stalled_at_str} for {blocked:.2f}s:\n{stack_str.rstrip()}"
+
+    def percentiles(self) -> dict:
+        """Loop lag percentiles in milliseconds"""
+        lags = sorted(self.lags)
+        if len(lags) == 0:
+            return dict(samples=0, p50=0.0, p90=0.0, p99=0.0, max=0.0)
+
+        def percentile(p: float) -> float:
+            return round(lags[min(len(lags) - 1, int(len(lags) * p))] * 1000, 1)
+
+        return dict(
+            samples=len(lags),
+            p50=percentile(0.5),
+            p90=percentile(0.9),
+            p99=percentile(0.99),
+            max=round(lags[-1] * 1000, 1),
+        )
+
+    def check_threshold(self, max_lag_ms: float = None) -> None:
+        """Raise LoopLagExceeded if p99 lag is over max_lag_ms, for benchmarks"""
+        if max_lag_ms is None:
+            max_lag_ms = gv.MAX_LOOP_LAG_MS
+        if max_lag_ms is None:
+            return
+        stats = self.percentiles()
+        if stats["p99"] > max_lag_ms:
+            raise LoopLagExceeded(
+                f"Event loop p99 lag {stats['p99']}ms is over {max_lag_ms}ms, "
+                f"slowest call sites: {self.slow_call_sites.most_common(3)}"
+            )
+
+
+loop_monitor = LoopMonitor()
@@ -0,0 +1,206 @@
+import asyncio
+from collections import Counter, OrderedDict, deque
+from typing import Any, Callable, Tuple
+import call_api
+import executors
+import global_variables as gv
+
+
+class QuotaExceeded(Exception):
+    """The guild or user already has too many checks waiting"""
+
+
+class Job:
+    def __init__(self, guild_id: int, user_id: int, func: Callable, args: tuple):
+        self.guild_id = guild_id
+        self.user_id = user_id
+        self.func = func
+        self.args = args
+        self.future = asyncio.get_running_loop().create_future()
+
+
+class FairScheduler:
+    """Queue checks per guild and run them round-robin across guilds
+
+    A guild runs at most GUILD_MAX_RUNNING checks at the same time and is
+    skipped while its checks used api_budget of the API in the window.
+    At most max_queue checks wait in all guilds together, when it is exceeded
+    the newest check of the guild with the most checks waiting raises
+    ExecutorBusy like an executor, so one guild cannot keep others out.
+    Blocking functions run on executor, without an executor functions are
+    coroutine functions awaited on the loop.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_running: int,
+        max_queue: int,
+        executor: executors.BoundedExecutor = None,
+        api_budget: Tuple[int, int] = None,
+    ):
+        self.name = name
+        self.max_running = max_running
+        self.max_queue = max_queue
+        self.executor = executor
+        self.api_budget = api_budget
+        self.rejected = 0
+        # guild_id -> deque of jobs, rotated for round-robin
+        self.queues = OrderedDict()
+        self.running = Counter()
+        self.total_running = 0
+        # (guild_id, user_id) -> queued and running checks
+        self.user_checks = Counter()
+        self.retry_handle = None
+
+    @staticmethod
+    def budget_key(guild_id: int) -> str:
+        return f"guild:{guild_id}"
+
+    def over_budget(self, guild_id: int) -> bool:
+        if self.api_budget is None:
+            return False
+        calls, window = self.api_budget
+        return call_api.recent_calls(self.budget_key(guild_id), window) >= calls
+
+    @property
+    def queued(self) -> int:
+        return sum(len(queue) for queue in self.queues.values())
+
+    async def submit(self, guild_id: int, user_id: int, func: Callable, *args) -> Any:
+        """Queue a blocking function for a guild and wait for its result"""
+        if self.user_checks[(guild_id, user_id)] >= gv.USER_MAX_CHECKS:
+            raise QuotaExceeded(
+                f"You already have {gv.USER_MAX_CHECKS} checks running, please wait"
+            )
+        queue = self.queues.setdefault(guild_id, deque())
+        if len(queue) >= gv.GUILD_MAX_QUEUED:
+            raise QuotaExceeded(
+                "Too many checks queued in this server, please try again later"
+            )
+
+        job = Job(guild_id, user_id, func, args)
+        queue.append(job)
+        self.user_checks[(guild_id, user_id)] += 1
+        self.dispatch()
+        if self.queued > self.max_queue:
+            self.reject_newest(guild_id)
+        return await job.future
+
+    def reject_newest(self, guild_id: int) -> None:
+        """Reject the newest job of the guild with the most jobs waiting
+
+        guild_id is the guild of the job just queued, which is rejected itself
+        when its guild is one of those with the most jobs waiting.
+        """
+        longest = max(
+            self.queues,
+            key=lambda queue_guild_id: (
+                len(self.queues[queue_guild_id]),
+                queue_guild_id == guild_id,
+            ),
+        )
+        queue = self.queues[longest]
+        job = queue.pop()
+        if len(queue) == 0:
+            del self.queues[longest]
+        self.release_user(job)
+        self.rejected += 1
+        job.future.set_exception(
+            executors.ExecutorBusy(f"{self.name} scheduler is busy")
+        )
+
+    def release_user(self, job: Job) -> None:
+        """Count a job of a user as finished"""
+        self.user_checks[(job.guild_id, job.user_id)] -= 1
+        if self.user_checks[(job.guild_id, job.user_id)] <= 0:
+            del self.user_checks[(job.guild_id, job.user_id)]
+
+    def next_job(self) -> Job:
+        """Take the first job of the next guild allowed to run, None if no guild"""
+        for _ in range(len(self.queues)):
+            guild_id, queue = next(iter(self.queues.items()))
+            self.queues.move_to_end(guild_id)
+            if len(queue) == 0:
+                del self.queues[guild_id]
+                continue
+            if self.running[guild_id] >= gv.GUILD_MAX_RUNNING:
+                continue
+            if self.over_budget(guild_id):
+                continue
+            job = queue.popleft()
+            if len(queue) == 0:
+                del self.queues[guild_id]
+            return job
+        return None
+
+    def dispatch(self) -> None:
+        """Start queued jobs while there are free workers"""
+        while self.total_running < self.max_running:
+            job = self.next_job()
+            if job is None:
+                break
+            self.running[job.guild_id] += 1
+            self.total_running += 1
+            asyncio.ensure_future(self.run_job(job))
+
+        # Guilds waiting for their API budget, try again later
+        if len(self.queues) > 0 and self.retry_handle is None:
+            self.retry_handle = asyncio.get_running_loop().call_later(
+                1, self.retry_dispatch
+            )
+
+    def retry_dispatch(self) -> None:
+        self.retry_handle = None
+        self.dispatch()
+
+    async def run_job(self, job: Job) -> None:
+        try:
+            if self.executor is None:
+                result = await job.func(*job.args)
+            else:
+                result = await self.executor.run(
+                    call_api.run_as, self.budget_key(job.guild_id), job.func, *job.args
+                )
+            if not job.future.done():
+                job.future.set_result(result)
+        except Exception as e:
+            if not job.future.done():
+                job.future.set_exception(e)
+        finally:
+            self.running[job.guild_id] -= 1
+            if self.running[job.guild_id] <= 0:
+                del self.running[job.guild_id]
+            self.release_user(job)
+            self.total_running -= 1
+            self.dispatch()
+
+    def stats(self) -> dict:
+        """Number of guilds and checks waiting and running"""
+        return dict(
+            name=self.name,
+            guilds_waiting=len(self.queues),
+            queued=self.queued,
+            running=self.total_running,
+            rejected=self.rejected,
+        )
+
+
+# /trend, and /check in standalone mode
+check_scheduler = FairScheduler(
+    "checks",
+    gv.IO_WORKERS,
+    gv.IO_MAX_QUEUE,
+    executors.io_executor,
+    gv.GUILD_API_BUDGET,
+)
+# /check in gateway mode, only waits for worker.py on the loop. API calls are made
+# by the workers and not counted here, so GUILD_API_BUDGET does not apply.
+remote_check_scheduler = FairScheduler(
+    "remote checks", gv.GATEWAY_MAX_JOBS, gv.GATEWAY_MAX_QUEUE
+)
+
+
+def all_stats() -> list:
+    """Stats of every scheduler"""
+    return [check_scheduler.stats(), remote_check_scheduler.stats()]
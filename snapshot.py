@@ -0,0 +1,55 @@
+import json
+import os
+import time
+import call_api
+import core
+import global_variables as gv
+
+# Increase when the format of the snapshot changes
+SNAPSHOT_VERSION = 2
+
+# Whether a snapshot has been loaded (or tried) in this process
+loaded = False
+
+
+def save(path: str = gv.SNAPSHOT_PATH) -> None:
+    """Save the hot working set to path"""
+    state = dict(
+        version=SNAPSHOT_VERSION,
+        saved_at=time.time(),
+        core=core.export_state(),
+        call_api=call_api.export_state(),
+    )
+    temp_path = path + ".tmp"
+    with open(temp_path, "w", encoding="utf-8") as file:
+        # Datetime from database are saved as string, as they are displayed
+        json.dump(state, file, default=str)
+    os.replace(temp_path, path)
+
+
+def load(path: str = gv.SNAPSHOT_PATH) -> bool:
+    """Load the snapshot at path if it is valid, return whether it is loaded"""
+    global loaded
+    loaded = True
+    if not os.path.exists(path):
+        return False
+
+    try:
+        with open(path, "r", encoding="utf-8") as file:
+            state = json.load(file)
+        if not isinstance(state, dict) or state.get("version") != SNAPSHOT_VERSION:
+            core.log(f"Snapshot {path} ignored, unknown version")
+            return False
+        age = time.time() - state["saved_at"]
+        if not 0 <= age < gv.SNAPSHOT_MAX_AGE:
+            core.log(f"Snapshot {path} ignored, saved {int(age)}s ago")
+            return False
+
+        entries = core.import_state(state["core"])
+        call_api.import_state(state["call_api"])
+    except Exception as e:
+        core.log(f"Snapshot {path} ignored, {str(e)}")
+        return False
+
+    core.log(f"Snapshot {path} loaded, {entries} entries")
+    return True
@@ -0,0 +1,61 @@
+import asyncio
+import os
+import unittest
+
+# global_variables reads them on import, no connection is made by these tests
+for name in [
+    "GUMAWILSON_DISCORD_TOKEN",
+    "GUMAWILSON_RIOT_API_KEY",
+    "GUMAWILSON_SQL_AC",
+    "GUMAWILSON_SQL_PW",
+]:
+    os.environ.setdefault(name, "test")
+
+import executors
+import global_variables as gv
+import scheduler
+
+
+class FairSchedulerTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.release = asyncio.Event()
+        self.check_scheduler = scheduler.FairScheduler("test", 2, 8)
+
+    async def check(self, guild_id: int) -> int:
+        await self.release.wait()
+        return guild_id
+
+    def submit(self, guild_id: int, user_id: int) -> asyncio.Task:
+        return asyncio.ensure_future(
+            self.check_scheduler.submit(guild_id, user_id, self.check, guild_id)
+        )
+
+    async def test_full_guild_does_not_make_other_guild_busy(self):
+        # Guild 1 fills its quota, 2 running and 8 waiting, from 5 users
+        guild_1 = [
+            self.submit(1, user_id // gv.USER_MAX_CHECKS)
+            for user_id in range(gv.GUILD_MAX_QUEUED)
+        ]
+        await asyncio.sleep(0)
+        self.assertEqual(self.check_scheduler.queued, 8)
+
+        guild_2 = self.submit(2, 100)
+        await asyncio.sleep(0)
+        # The newest check of guild 1 gives way
+        with self.assertRaises(executors.ExecutorBusy):
+            await asyncio.wait_for(guild_1[-1], 1)
+        self.assertEqual(self.check_scheduler.queued, 8)
+
+        # More checks of guild 1 are rejected rather than the one of guild 2
+        guild_1_again = self.submit(1, 200)
+        with self.assertRaises(executors.ExecutorBusy):
+            await asyncio.wait_for(guild_1_again, 1)
+
+        self.release.set()
+        self.assertEqual(await guild_2, 2)
+        self.assertEqual(await asyncio.gather(*guild_1[:-1]), [1] * 9)
+        self.assertEqual(len(self.check_scheduler.user_checks), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+"""Keep the partitioned match tables small, run daily e.g. by cron
+
+Usage:
+    python tiering.py [--hot-months 12] [--untracked-days 30]
+
+Creates monthly partitions ahead of time, moves rows of untracked players
+and every match older than the hot period to the archive tables. Archived
+matches are still read by /check when they are not found in the hot tables.
+Needs ForSetupEnviornment/partition.sql applied.
+"""
+
+import argparse
+import time
+from datetime import date, datetime, timedelta
+from typing import List
+import core
+import database_operations as dbo
+import global_variables as gv
+
+
+def months_ago(months: int) -> date:
+    """First day of the month, months before this month"""
+    today = date.today()
+    month_index = today.year * 12 + today.month - 1 - months
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def main(argv: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(description="Partition and archive matches")
+    parser.add_argument(
+        "--hot-months",
+        type=int,
+        default=gv.HOT_MONTHS,
+        help="Months of matches kept in the partitioned tables",
+    )
+    parser.add_argument(
+        "--untracked-days",
+        type=int,
+        default=gv.UNTRACKED_HOT_DAYS,
+        help="Days before rows of players not in summoners are archived",
+    )
+    args = parser.parse_args(argv)
+
+    started_at = time.time()
+    for table in ["matches", "match_players"]:
+        dbo.add_month_partitions(table, gv.PARTITION_MONTHS_AHEAD)
+    core.log(f"Partitions created up to {gv.PARTITION_MONTHS_AHEAD} months ahead")
+
+    untracked_before = datetime.now() - timedelta(days=args.untracked_days)
+    archived = dbo.archive_untracked_match_players(
+        untracked_before.strftime("%Y-%m-%d %H:%M:%S")
+    )
+    core.log(f"{archived} rows of untracked players archived")
+
+    # Whole months only, so that old partitions are dropped instead of deleted
+    hot_from = months_ago(args.hot_months)
+    dbo.archive_before(hot_from.strftime("%Y-%m-%d"))
+    core.log(f"Matches before {hot_from} archived")
+
+    core.log(f"Tiering finished in {time.time() - started_at:.0f}s")
+
+
+if __name__ == "__main__":
+    main()
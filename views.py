@@ -0,0 +1,61 @@
+from typing import List
+import discord
+import core
+import global_variables as gv
+
+
+class CheckPaginator(discord.ui.View):
+    """Previous / next buttons for a check, game pages are rendered when shown"""
+
+    def __init__(self, summary_pages: List[str], detailed_rows: List[dict]):
+        super().__init__(timeout=gv.PAGINATOR_TIMEOUT)
+        self.summary_pages = summary_pages
+        self.detailed_rows = detailed_rows
+        self.page = 0
+        self.total_pages = len(summary_pages) + core.count_game_pages(detailed_rows)
+        self.update_buttons()
+
+    def render(self) -> str:
+        """Render the current page"""
+        if self.page < len(self.summary_pages):
+            text = self.summary_pages[self.page]
+        else:
+            text = core.render_game_page(
+                self.detailed_rows, self.page - len(self.summary_pages)
+            )
+        return f"```{text}```Page {self.page + 1}/{self.total_pages}"
+
+    def update_buttons(self) -> None:
+        self.previous.disabled = self.page == 0
+        self.next.disabled = self.page == self.total_pages - 1
+
+    async def show_page(self, interaction: discord.Interaction, page: int) -> None:
+        self.page = page
+        self.update_buttons()
+        await interaction.response.edit_message(content=self.render(), view=self)
+
+    @discord.ui.button(label="Previous", style=discord.ButtonStyle.secondary)
+    async def previous(
+        self, button: discord.ui.Button, interaction: discord.Interaction
+    ):
+        await self.show_page(interaction, max(0, self.page - 1))
+
+    @discord.ui.button(label="Next", style=discord.ButtonStyle.primary)
+    async def next(self, button: discord.ui.Button, interaction: discord.Interaction):
+        await self.show_page(interaction, min(self.total_pages - 1, self.page + 1))
+
+    async def on_timeout(self) -> None:
+        self.disable_all_items()
+        if self.message is not None:
+            await self.message.edit(view=self)
+
+
+async def send_check_result(
+    ctx, summary_pages: List[str], detailed_rows: List[dict]
+) -> None:
+    """Send the first page of a check, with buttons if there are more pages"""
+    view = CheckPaginator(summary_pages, detailed_rows)
+    if view.total_pages == 1:
+        await ctx.send(f"```{summary_pages[0]}```")
+    else:
+        await ctx.send(view.render(), view=view)
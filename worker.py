@@ -0,0 +1,43 @@
+"""Run checks queued by the bot in gateway mode
+
+Usage:
+    python worker.py [--threads 4]
+
+Start the bot with GUMAWILSON_MODE=gateway, then run any number of workers
+on hosts that can reach the database. Workers share the API rate limit
+through the rate_calls table.
+"""
+
+import argparse
+import threading
+from typing import List
+import core
+import global_variables as gv
+import jobs
+
+
+def main(argv: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(description="Run queued checks")
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=gv.IO_WORKERS,
+        help="Checks to run at the same time",
+    )
+    args = parser.parse_args(argv)
+
+    gv.distributed = True
+    threads = []
+    for index in range(args.threads):
+        worker = f"{gv.WORKER_ID}:{index}"
+        thread = threading.Thread(target=jobs.worker_loop, args=(worker,), name=worker)
+        thread.start()
+        threads.append(thread)
+    core.log(f"Worker {gv.WORKER_ID} started with {args.threads} threads")
+
+    for thread in threads:
+        thread.join()
+
+
+if __name__ == "__main__":
+    main()